@@ -0,0 +1,213 @@
+"""
+AG Grid server-side row model queries for /api/grid/rows.
+Translates one IServerSideGetRowsRequest (startRow/endRow, rowGroupCols,
+groupKeys, valueCols, sortModel, filterModel) into a single statement
+over employees/managers:
+
+  - while groupKeys is shorter than rowGroupCols, the rows of the next
+    group level (GROUP BY that column, with a child count and any value
+    column aggregates) under the already opened groups;
+  - once every group is open, the leaf rows of that group.
+
+Only columns listed in GRID_COLUMNS can be sorted, filtered or grouped
+on, and every value is a bind parameter. Like search.py, one extra row
+is fetched to tell whether the block is the last one.
+"""
+
+import math
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from sqlalchemy import text
+
+from search import escape_like
+
+GRID_FROM = """
+    FROM employees e
+    LEFT JOIN managers m ON e.manager_id = m.id
+"""
+
+# Grid field -> SQL expression
+GRID_COLUMNS = {
+    "id": "e.id",
+    "name": "e.name",
+    "email": "e.email",
+    "role": "e.role",
+    "country": "e.country",
+    "manager_id": "e.manager_id",
+    "manager_name": "m.name",
+    "page": "e.page",
+    "snippet": "e.snippet",
+    "path": "e.path",
+}
+
+NUMERIC_COLUMNS = {"id", "manager_id", "page"}
+# Columns a text filter can compare directly; the rest (numbers, the path
+# array) are compared as their text form
+TEXT_COLUMNS = {"name", "email", "role", "country", "manager_name", "snippet"}
+
+AGGREGATES = {"sum": "SUM", "avg": "AVG", "min": "MIN", "max": "MAX", "count": "COUNT"}
+
+TEXT_FILTERS = {
+    "equals": ("{col} = {p}", "{}"),
+    "notEqual": ("{col} IS DISTINCT FROM {p}", "{}"),
+    "contains": ("{col} ILIKE {p}", "%{}%"),
+    "notContains": ("{col} NOT ILIKE {p}", "%{}%"),
+    "startsWith": ("{col} ILIKE {p}", "{}%"),
+    "endsWith": ("{col} ILIKE {p}", "%{}"),
+}
+
+NUMBER_FILTERS = {
+    "equals": "{col} = {p}",
+    "notEqual": "{col} IS DISTINCT FROM {p}",
+    "lessThan": "{col} < {p}",
+    "lessThanOrEqual": "{col} <= {p}",
+    "greaterThan": "{col} > {p}",
+    "greaterThanOrEqual": "{col} >= {p}",
+}
+
+# Most rows one block may ask for
+GRID_MAX_BLOCK_SIZE = 5000
+
+
+def _column(field: str) -> str:
+    if field not in GRID_COLUMNS:
+        raise ValueError(f"Unknown grid column: {field!r}")
+    return GRID_COLUMNS[field]
+
+
+def _number(value) -> Union[int, float]:
+    """A number filter value; raises ValueError unless it is a finite number"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"Invalid number filter value: {value!r}")
+    if isinstance(value, int):
+        return value
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"Invalid number filter value: {value!r}") from None
+    if not math.isfinite(number):
+        raise ValueError(f"Invalid number filter value: {value!r}")
+    return number
+
+
+class _Params:
+    """Bind parameter names p0, p1, ... for generated SQL"""
+
+    def __init__(self):
+        self.values: Dict[str, Any] = {}
+
+    def add(self, value) -> str:
+        name = f"p{len(self.values)}"
+        self.values[name] = value
+        return f":{name}"
+
+
+def _condition(field: str, model: dict, params: _Params) -> str:
+    """SQL for one column filter model (simple or combined with AND/OR)"""
+    col = _column(field)
+
+    conditions = model.get("conditions")
+    if conditions is None and "condition1" in model:
+        conditions = [model["condition1"], model["condition2"]]
+    if conditions is not None:
+        operator = " OR " if str(model.get("operator", "AND")).upper() == "OR" else " AND "
+        # Child conditions inherit the column's filterType
+        return "(" + operator.join(
+            _condition(field, {"filterType": model.get("filterType"), **condition}, params) for condition in conditions
+        ) + ")"
+
+    filter_type = model.get("filterType") or "text"
+    kind = model.get("type")
+
+    if filter_type == "set":
+        values = [value for value in model.get("values") or [] if value is not None]
+        # Set filter values arrive as strings whatever the column type
+        clause = f"CAST({col} AS text) = ANY({params.add([str(value) for value in values])})"
+        if None in (model.get("values") or []):
+            clause = f"({clause} OR {col} IS NULL)"
+        return clause
+    if kind == "blank":
+        return f"({col} IS NULL OR CAST({col} AS text) = '')"
+    if kind == "notBlank":
+        return f"({col} IS NOT NULL AND CAST({col} AS text) <> '')"
+
+    if filter_type == "number":
+        if kind == "inRange":
+            low, high = _number(model.get("filter")), _number(model.get("filterTo"))
+            return f"{col} BETWEEN {params.add(low)} AND {params.add(high)}"
+        if kind not in NUMBER_FILTERS:
+            raise ValueError(f"Unsupported number filter: {kind!r}")
+        return NUMBER_FILTERS[kind].format(col=col, p=params.add(_number(model.get("filter"))))
+
+    if kind not in TEXT_FILTERS:
+        raise ValueError(f"Unsupported text filter: {kind!r}")
+    template, pattern = TEXT_FILTERS[kind]
+    if field not in TEXT_COLUMNS:
+        col = f"CAST({col} AS text)"
+    value = str(model.get("filter", ""))
+    if "%" in pattern:
+        value = escape_like(value)
+    return template.format(col=col, p=params.add(pattern.format(value)))
+
+
+def build_grid_query(request: dict) -> Tuple[Any, dict, int, int]:
+    """
+    Build the statement for one block of rows.
+    Returns (statement, bind parameters, start row, block size); the
+    statement fetches block size + 1 rows.
+    """
+    start_row = max(0, int(request.get("startRow") or 0))
+    end_row = int(request.get("endRow") or start_row + 100)
+    block_size = min(max(1, end_row - start_row), GRID_MAX_BLOCK_SIZE)
+
+    group_cols: List[dict] = request.get("rowGroupCols") or []
+    group_keys: List[Optional[str]] = request.get("groupKeys") or []
+    value_cols: List[dict] = request.get("valueCols") or []
+    sort_model: List[dict] = request.get("sortModel") or []
+    filter_model: Dict[str, dict] = request.get("filterModel") or {}
+
+    params = _Params()
+    where = [_condition(field, model, params) for field, model in filter_model.items()]
+    # Opened groups: a null key is the "(Blanks)" group
+    for group_col, key in zip(group_cols, group_keys):
+        where.append(f"{_column(group_col['field'])} IS NOT DISTINCT FROM {params.add(key)}")
+    where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+
+    grouping = len(group_keys) < len(group_cols)
+    if grouping:
+        field = group_cols[len(group_keys)]["field"]
+        group_col = _column(field)
+        selected = [f"{group_col} AS {field}", "COUNT(*) AS child_count"]
+        sortable = {field: group_col, "child_count": "COUNT(*)"}
+        for value_col in value_cols:
+            aggregate = AGGREGATES.get(value_col.get("aggFunc"))
+            if aggregate is None or value_col["field"] not in NUMERIC_COLUMNS:
+                raise ValueError(f"Unsupported aggregation on {value_col['field']!r}")
+            expression = f"{aggregate}({_column(value_col['field'])})"
+            selected.append(f"{expression} AS {value_col['field']}")
+            sortable[value_col["field"]] = expression
+        query = f"SELECT {', '.join(selected)} {GRID_FROM}{where_sql} GROUP BY {group_col}"
+        tiebreak = group_col
+    else:
+        selected = [f"{expression} AS {field}" for field, expression in GRID_COLUMNS.items()]
+        query = f"SELECT {', '.join(selected)} {GRID_FROM}{where_sql}"
+        sortable = GRID_COLUMNS
+        tiebreak = "e.id"
+
+    order = []
+    for sort in sort_model:
+        # Sorts on columns that don't exist at this group level are ignored, as AG Grid does
+        if sort.get("colId") in sortable:
+            direction = "DESC NULLS LAST" if sort.get("sort") == "desc" else "ASC NULLS FIRST"
+            order.append(f"{sortable[sort['colId']]} {direction}")
+    order.append(tiebreak)
+
+    query += f" ORDER BY {', '.join(order)} LIMIT {params.add(block_size + 1)} OFFSET {params.add(start_row)}"
+    return text(query), params.values, start_row, block_size
+
+
+def block_response(rows: List[dict], start_row: int, block_size: int) -> dict:
+    """AG Grid success params: rowCount is only known once the last block is reached"""
+    if len(rows) > block_size:
+        return {"rowData": rows[:block_size], "rowCount": -1}
+    return {"rowData": rows, "rowCount": start_row + len(rows)}
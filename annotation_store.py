@@ -0,0 +1,163 @@
+"""
+Version-checked, coalesced writes for /api/annotations/save.
+
+Every annotations row carries a revision (see models.Annotation). A save
+may name the revision it was based on, as an If-Match ETag or a body
+`version`; the write is then a conditional UPDATE that only succeeds if
+nobody else wrote in between, and VersionConflict is raised otherwise.
+Saves without a version are single-statement upserts.
+
+SaveCoalescer holds each employee's first save for ANNOTATION_COALESCE_MS
+and lets later unconditional saves replace its document, so an autosave
+burst becomes one DB write of the newest state. Every caller in the burst
+gets that write's result. A conditional save is never merged: it waits for
+the pending write and is then checked against the revision it produced,
+so two clients editing the same revision can't both succeed.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# 0 disables coalescing
+ANNOTATION_COALESCE_SECONDS = float(os.getenv("ANNOTATION_COALESCE_MS", "250")) / 1000
+
+# (row id or None, revision), "*" (must exist) or None (unconditional)
+Expected = Union[Tuple[Optional[int], int], str, None]
+
+UPSERT_SQL = text("""
+    INSERT INTO annotations (employee_id, annotations, revision)
+    VALUES (:employee_id, :document, 1)
+    ON CONFLICT (employee_id) DO UPDATE
+    SET annotations = EXCLUDED.annotations, revision = annotations.revision + 1
+    RETURNING id, revision
+""").bindparams(bindparam("document", type_=JSONB))
+
+CONDITIONAL_UPDATE_SQL = text("""
+    UPDATE annotations
+    SET annotations = :document, revision = revision + 1
+    WHERE employee_id = :employee_id
+      AND (CAST(:row_id AS integer) IS NULL OR id = :row_id)
+      AND (CAST(:revision AS integer) IS NULL OR revision = :revision)
+    RETURNING id, revision
+""").bindparams(bindparam("document", type_=JSONB))
+
+CURRENT_SQL = text("SELECT id, revision FROM annotations WHERE employee_id = :employee_id")
+
+
+class VersionConflict(Exception):
+    """The stored annotations changed since the revision the client sent"""
+
+    def __init__(self, current: Optional[Tuple[int, int]]):
+        super().__init__("Annotations were modified by another save")
+        self.current = current
+
+
+def format_etag(row_id: int, revision: int) -> str:
+    # The row id guards against a deleted and recreated row reusing revision numbers
+    return f'"{row_id}-{revision}"'
+
+
+def parse_if_match(header: Optional[str]) -> Expected:
+    """
+    Expected version from an If-Match header; a malformed tag can never
+    match. If-Match uses strong comparison, so weak (W/) tags never match.
+    """
+    if header is None:
+        return None
+    header = header.strip()
+    if header == "*":
+        return "*"
+    try:
+        if header.startswith("W/"):
+            raise ValueError("weak validator")
+        row_id, revision = header.strip('"').split("-")
+        return int(row_id), int(revision)
+    except ValueError:
+        return -1, -1
+
+
+def write_annotations(db: Session, employee_id: int, document: Any, expected: Expected) -> Tuple[int, int]:
+    """Store an employee's annotations; returns (row id, new revision). Caller commits."""
+    if expected is None:
+        row = db.execute(UPSERT_SQL, {"employee_id": employee_id, "document": document}).one()
+        return row.id, row.revision
+
+    row_id, revision = (None, None) if expected == "*" else expected
+    row = db.execute(CONDITIONAL_UPDATE_SQL, {
+        "employee_id": employee_id, "document": document, "row_id": row_id, "revision": revision
+    }).first()
+    if row is None:
+        current = db.execute(CURRENT_SQL, {"employee_id": employee_id}).first()
+        raise VersionConflict(tuple(current) if current else None)
+    return row.id, row.revision
+
+
+class _PendingSave:
+    __slots__ = ("document", "expected", "saves", "writing", "future")
+
+    def __init__(self, document, expected: Expected, future: asyncio.Future):
+        self.document = document
+        self.expected = expected
+        self.saves = 1
+        self.writing = False
+        self.future = future
+
+
+class SaveCoalescer:
+    """
+    Collapses saves per key that arrive within `window` seconds into one
+    call of `write(key, document, expected)`, run in the threadpool.
+    Results are (write's result, number of saves it covered).
+    """
+
+    def __init__(self, write: Callable, window: float = ANNOTATION_COALESCE_SECONDS):
+        self.write = write
+        self.window = window
+        self._pending: Dict[Any, _PendingSave] = {}
+        self._tasks = set()
+
+    async def submit(self, key, document, expected: Expected = None):
+        if self.window <= 0:
+            return await run_in_threadpool(self.write, key, document, expected), 1
+
+        pending = self._pending.get(key)
+        # Only unconditional saves merge; merging two saves based on the same
+        # revision would let one silently overwrite the other
+        if pending is not None and not pending.writing and pending.expected is None and expected is None:
+            pending.document = document
+            pending.saves += 1
+            return await asyncio.shield(pending.future)
+
+        batch = _PendingSave(document, expected, asyncio.get_running_loop().create_future())
+        self._pending[key] = batch
+        # A task, so the write still happens if the request that started it disconnects
+        task = asyncio.create_task(self._flush(key, batch, pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return await asyncio.shield(batch.future)
+
+    async def _flush(self, key, batch: _PendingSave, previous: Optional[_PendingSave]):
+        try:
+            await asyncio.sleep(self.window)
+            if previous is not None:
+                # Land the earlier write first, so this one is checked against it
+                await asyncio.wait([previous.future])
+            batch.writing = True
+            result = await run_in_threadpool(self.write, key, batch.document, batch.expected)
+            if batch.saves > 1:
+                logger.debug("Coalesced %d saves for %s into one write", batch.saves, key)
+            batch.future.set_result((result, batch.saves))
+        except Exception as e:
+            batch.future.set_exception(e)
+        finally:
+            if self._pending.get(key) is batch:
+                del self._pending[key]
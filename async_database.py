@@ -0,0 +1,49 @@
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from database import DATABASE_URL
+from db_pool import CONNECT_TIMEOUT, POOL_OPTIONS
+from metrics import Histogram
+import query_profiler
+import os
+import time
+
+# Same database as database.py, reached through the asyncpg driver
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records how long each checkout waited for a connection"""
+
+    wait_seconds = Histogram()
+    timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            type(self).timeouts += 1
+            raise
+        finally:
+            self.wait_seconds.observe(time.perf_counter() - started)
+
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=TimedAsyncQueuePool,
+    connect_args={"timeout": CONNECT_TIMEOUT},
+    **POOL_OPTIONS
+)
+if query_profiler.ENABLED:
+    query_profiler.instrument(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autocommit=False, autoflush=False)
+
+
+# Dependency
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,71 @@
+"""
+Async serving mode for the main API, enabled with DB_MODE=async.
+install() swaps the sync routes marked @io_bound (and taking a
+`db: Session`) for an `async def` wrapper that runs the same handler on
+an AsyncSession via run_sync(). Database waits then no longer hold one of
+Starlette's threadpool workers, and the handlers in main.py remain the
+only implementation.
+
+run_sync() executes the handler body on the event loop, so any Python
+work in it (ORM loading, PDF text, encoding large results) stalls every
+other request. Only handlers that run a few short queries and little else
+are marked; the rest keep running in the threadpool on the sync engine.
+"""
+
+import inspect
+
+from fastapi import Depends, FastAPI
+from fastapi.routing import APIRoute
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def io_bound(endpoint):
+    """Mark a sync handler as cheap enough outside its queries to run on the event loop"""
+    endpoint.__io_bound__ = True
+    return endpoint
+
+
+def to_async(endpoint):
+    """Wrap a sync handler taking `db: Session` so it runs on an AsyncSession"""
+    # Imported here so main.py can use @io_bound without creating the async engine
+    from async_database import get_async_db
+
+    signature = inspect.signature(endpoint)
+    parameters = [
+        param.replace(annotation=AsyncSession, default=Depends(get_async_db)) if param.name == "db" else param
+        for param in signature.parameters.values()
+    ]
+
+    async def async_endpoint(db: AsyncSession, **kwargs):
+        return await db.run_sync(lambda session: endpoint(db=session, **kwargs))
+
+    # Keep markers such as @query_budget; FastAPI reads parameters from __signature__
+    async_endpoint.__dict__.update(endpoint.__dict__)
+    async_endpoint.__signature__ = signature.replace(parameters=parameters)
+    async_endpoint.__name__ = endpoint.__name__
+    async_endpoint.__doc__ = endpoint.__doc__
+    return async_endpoint
+
+
+def install(app: FastAPI):
+    """Replace the app's @io_bound sync database routes with async ones, keeping route order"""
+    for index, route in enumerate(app.router.routes):
+        if not isinstance(route, APIRoute) or inspect.iscoroutinefunction(route.endpoint):
+            continue
+        if not getattr(route.endpoint, "__io_bound__", False):
+            continue
+        if "db" not in inspect.signature(route.endpoint).parameters:
+            continue
+
+        app.router.routes.pop(index)
+        app.add_api_route(
+            route.path,
+            to_async(route.endpoint),
+            methods=list(route.methods),
+            response_model=route.response_model,
+            status_code=route.status_code,
+            name=route.name,
+            include_in_schema=route.include_in_schema
+        )
+        # add_api_route appends; move the new route back to where the old one was
+        app.router.routes.insert(index, app.router.routes.pop())
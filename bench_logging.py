@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark for per-row tracing in the list handlers.
+Replays the output /api/search used to produce (two print() calls per
+employee) against the logging_config setup it was replaced with, writing
+to a pipe the way a container's stdout does. Reports rows/second for
+each mode as seen by the request thread (the queue listener writes in
+the background); no database is needed.
+"""
+
+import contextlib
+import io
+import logging
+import os
+import threading
+import time
+
+import logging_config
+
+ROWS = 100_000
+
+
+def make_rows(count):
+    return [{"id": i, "name": f"Employee {i}", "manager_name": f"Manager {i % 100}"} for i in range(count)]
+
+
+@contextlib.contextmanager
+def pipe_stdout():
+    """Point a line-buffered text stream at a pipe drained by a background thread"""
+    read_fd, write_fd = os.pipe()
+    drain = threading.Thread(target=lambda: [None for _ in iter(lambda: os.read(read_fd, 65536), b"")], daemon=True)
+    drain.start()
+    stream = io.TextIOWrapper(io.FileIO(write_fd, "w"), line_buffering=True)
+    try:
+        yield stream
+    finally:
+        stream.close()
+        drain.join()
+        os.close(read_fd)
+
+
+def bench_print(rows, stream):
+    for emp in rows:
+        print(f"Employee: {emp['name']} under manager: {emp.get('manager_name', 'No Manager')}", file=stream)
+    print(f"\nReturning {len(rows)} employees for row grouping:", file=stream)
+    for emp in rows:
+        print(f"  - {emp['name']} (manager: {emp.get('manager_name', 'None')})", file=stream)
+
+
+def bench_logging(rows, logger):
+    if logger.isEnabledFor(logging.DEBUG):
+        for emp in rows:
+            logger.debug("Employee %s under manager %s", emp['name'], emp.get('manager_name'))
+    logger.info("Returning %d employees for row grouping", len(rows))
+
+
+def timed(label, fn):
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40} {elapsed * 1000:>10.1f} ms {ROWS / elapsed:>14,.0f} rows/s")
+
+
+def wait_for_queue():
+    """Let the listener drain the previous run so it doesn't compete with the next one"""
+    log_queue = logging.getLogger().handlers[0].queue
+    while not log_queue.empty():
+        time.sleep(0.01)
+
+
+def run_benchmark():
+    rows = make_rows(ROWS)
+
+    with pipe_stdout() as stream:
+        timed("print() per row (before)", lambda: bench_print(rows, stream))
+
+    with pipe_stdout() as stream:
+        # Route the queue listener's output to the pipe instead of the terminal
+        real_stdout = logging_config.sys.stdout
+        logging_config.sys.stdout = stream
+        try:
+            logging_config.setup_logging()
+        finally:
+            logging_config.sys.stdout = real_stdout
+        logger = logging.getLogger("bench")
+
+        timed("logging, DEBUG off (default)", lambda: bench_logging(rows, logger))
+        logger.setLevel(logging.DEBUG)
+        timed("logging, DEBUG on, queued", lambda: bench_logging(rows, logger))
+        wait_for_queue()
+        logging.getLogger().handlers[0].filters[-1].rate = 0.01
+        timed("logging, DEBUG on, 1% sampled", lambda: bench_logging(rows, logger))
+        logging_config.stop_logging()
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the ranked /api/search query.
+Seeds a scratch schema with 10k, 100k and 1M employees, then reports
+p50/p95 latency of build_ranked_search_query at each size, overall and
+for the 1-2 character terms of the first keystrokes, which the GIN
+trigram index cannot serve. With the GiST trigram indexes from
+migrate.py, p95 should stay roughly flat as the table grows. The scratch
+schema is dropped afterwards.
+"""
+
+import random
+import statistics
+import time
+
+from sqlalchemy import create_engine, text
+from database import DATABASE_URL, Base
+from migrate import apply_migrations
+from search import build_ranked_search_query
+import models  # noqa: F401 - registers the tables on Base.metadata
+
+SCHEMA = "bench_search"
+SIZES = [10_000, 100_000, 1_000_000]
+MANAGERS = 1_000
+QUERIES = 200
+
+
+def seed_employees(conn, start, stop):
+    """Insert employees start+1..stop with pseudo-random names"""
+    conn.execute(text("""
+        INSERT INTO employees (name, email, role, manager_id, country)
+        SELECT initcap(substr(md5(g::text), 1, 8)) || ' ' || initcap(substr(md5((g * 7)::text), 1, 10)),
+               'emp' || g || '@example.com', 'Engineer', 1 + (g % :managers), 'India'
+        FROM generate_series(:start + 1, :stop) g
+    """), {"start": start, "stop": stop, "managers": MANAGERS})
+    conn.execute(text("ANALYZE employees"))
+
+
+def random_terms(count):
+    """Search terms the way a user types them: the first 1-6 characters of a name"""
+    alphabet = "0123456789abcdef"
+    return ["".join(random.choice(alphabet) for _ in range(random.randint(1, 6))) for _ in range(count)]
+
+
+def p95(timings):
+    return statistics.quantiles(timings, n=20)[-1]
+
+
+def run_benchmark():
+    engine = create_engine(DATABASE_URL)
+
+    with engine.connect() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        # pg_trgm lives in public, so keep it on the search path
+        conn.execute(text(f"SET search_path TO {SCHEMA}, public"))
+        conn.commit()
+
+        try:
+            Base.metadata.create_all(bind=conn)
+            conn.execute(text("""
+                INSERT INTO managers (name, email, role)
+                SELECT 'Manager ' || substr(md5(g::text), 1, 6), 'mgr' || g || '@example.com', 'Manager'
+                FROM generate_series(1, :managers) g
+            """), {"managers": MANAGERS})
+            apply_migrations(conn)
+            conn.commit()
+
+            print(f"{'rows':>10} {'p50 ms':>10} {'p95 ms':>10} {'p95 1-2 chars':>14}")
+            seeded = 0
+            for size in SIZES:
+                seed_employees(conn, seeded, size)
+                conn.commit()
+                seeded = size
+
+                timings = []
+                short_timings = []
+                for term in random_terms(QUERIES):
+                    query, params = build_ranked_search_query(term)
+                    started = time.perf_counter()
+                    conn.execute(query, params).fetchall()
+                    elapsed = (time.perf_counter() - started) * 1000
+                    timings.append(elapsed)
+                    if len(term) <= 2:
+                        short_timings.append(elapsed)
+
+                print(f"{size:>10} {statistics.median(timings):>10.2f} {p95(timings):>10.2f} {p95(short_timings):>14.2f}")
+        finally:
+            conn.rollback()
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            conn.commit()
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the /api/search JSON response path.
+Encodes the same search rows two ways: the old path (a dict literal per
+row, FastAPI's jsonable_encoder, then the stdlib JSONResponse) and the
+new one (a RowEncoder over the result's keys, as the handler builds it,
+through serialization.dumps, orjson when installed). Reports
+milliseconds and bytes/second for each at a few result sizes. Rows are
+namedtuples standing in for SQLAlchemy Rows (both support attribute and
+positional access); no database is needed.
+"""
+
+import time
+from collections import namedtuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import serialization
+from serialization import RowEncoder
+
+SIZES = [1_000, 10_000, 100_000]
+REPEAT = 3
+
+# Columns of search.SEARCH_SELECT
+SearchRow = namedtuple("SearchRow", (
+    "id", "name", "email", "role", "manager_id", "country",
+    "x0", "x1", "y0", "y1", "page", "snippet", "manager_name", "path",
+))
+
+
+def make_rows(count):
+    return [
+        SearchRow(i, f"Employee {i}", f"emp{i}@example.com", "Engineer", i % 100, "India",
+                  72.0 + i % 400, 180.5, 96.25, 108.75, i % 40, f"Employee {i} Engineer",
+                  f"Manager {i % 100}", ["Director", f"Manager {i % 100}", f"Employee {i}"])
+        for i in range(count)
+    ]
+
+
+def encode_before(rows) -> bytes:
+    """What /api/search did: dict literal per row, jsonable_encoder, stdlib json"""
+    data = [{
+        "id": row.id,
+        "name": row.name,
+        "email": row.email,
+        "role": row.role,
+        "manager_id": row.manager_id,
+        "country": row.country,
+        "x0": row.x0,
+        "x1": row.x1,
+        "y0": row.y0,
+        "y1": row.y1,
+        "page": row.page,
+        "snippet": row.snippet,
+        "manager_name": row.manager_name,
+        "path": row.path
+    } for row in rows]
+    return JSONResponse(jsonable_encoder(data)).body
+
+
+def encode_after(rows) -> bytes:
+    return RowEncoder(SearchRow._fields).encode(rows)
+
+
+def best_of(encode, rows):
+    """Fastest of REPEAT runs, in seconds, and the encoded size"""
+    best = float("inf")
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        body = encode(rows)
+        best = min(best, time.perf_counter() - started)
+    return best, len(body)
+
+
+def run_benchmark():
+    print(f"encoder: {'orjson' if serialization.orjson is not None else 'json (orjson not installed)'}")
+    print(f"{'rows':>8} {'before ms':>10} {'before MB/s':>12} {'after ms':>10} {'after MB/s':>11} {'speedup':>8}")
+    for size in SIZES:
+        rows = make_rows(size)
+        assert serialization.orjson is None or encode_before(rows) == encode_after(rows)
+
+        before, before_bytes = best_of(encode_before, rows)
+        after, after_bytes = best_of(encode_after, rows)
+        print(f"{size:>8} {before * 1000:>10.1f} {before_bytes / before / 1e6:>12.1f} "
+              f"{after * 1000:>10.1f} {after_bytes / after / 1e6:>11.1f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,235 @@
+"""
+Set-based employee import used by /upload/ and /upload/stream.
+Managers named in the payload are resolved or created with a single
+INSERT ... ON CONFLICT ... RETURNING, then employees are written in
+chunks of UPLOAD_CHUNK_SIZE rows with COPY (psycopg2) or multi-row
+INSERTs. Each chunk runs in its own SAVEPOINT, so one bad chunk is
+reported and rolled back without losing the others, and the caller
+commits once at the end.
+"""
+
+import codecs
+import csv
+import io
+import json
+import logging
+import os
+from typing import AsyncIterator, Dict, Iterable, List, Tuple
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+from hierarchy import refresh_missing_paths
+from models import Employee
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", "5000"))
+# "copy" falls back to "insert" when the driver has no COPY support (e.g. asyncpg via run_sync)
+UPLOAD_METHOD = os.getenv("UPLOAD_METHOD", "copy")
+# Longest record /upload/stream buffers, in characters; longer ones are reported and skipped
+UPLOAD_MAX_RECORD_LENGTH = int(os.getenv("UPLOAD_MAX_RECORD_LENGTH", str(64 * 1024)))
+
+EMPLOYEE_COLUMNS = ("name", "email", "role", "manager_id", "country", "snippet")
+
+RESOLVE_MANAGERS_SQL = text("""
+    WITH wanted AS (
+        SELECT DISTINCT unnest(CAST(:names AS text[])) AS name
+    ),
+    existing AS (
+        SELECT DISTINCT ON (m.name) m.name, m.id
+        FROM managers m JOIN wanted w ON w.name = m.name
+        ORDER BY m.name, m.id
+    ),
+    inserted AS (
+        INSERT INTO managers (name, email, role)
+        -- Names differing only in case share an email; ON CONFLICT DO UPDATE
+        -- may touch a row only once per statement, so insert one of them
+        SELECT DISTINCT ON (lower(w.name)) w.name, lower(w.name) || '@example.com', 'Manager'
+        FROM wanted w
+        WHERE w.name NOT IN (SELECT name FROM existing)
+        ORDER BY lower(w.name), w.name
+        ON CONFLICT (email) DO UPDATE SET email = EXCLUDED.email
+        RETURNING id, email
+    )
+    SELECT name, id FROM existing
+    UNION ALL
+    SELECT w.name, i.id FROM inserted i JOIN wanted w ON lower(w.name) || '@example.com' = i.email
+""")
+
+
+def resolve_managers(db: Session, names: Iterable[str]) -> Dict[str, int]:
+    """Map manager names to ids, creating missing managers, in one statement"""
+    names = sorted(set(names))
+    if not names:
+        return {}
+    return {row.name: row.id for row in db.execute(RESOLVE_MANAGERS_SQL, {"names": names})}
+
+
+def _copy_supported(db: Session) -> bool:
+    dbapi_connection = db.connection().connection.dbapi_connection
+    return type(dbapi_connection).__module__.startswith("psycopg2")
+
+
+def copy_employees(db: Session, rows: List[dict]):
+    """Stream rows into employees with COPY ... FROM STDIN (CSV; None becomes NULL)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in EMPLOYEE_COLUMNS])
+    buffer.seek(0)
+
+    dbapi_connection = db.connection().connection.dbapi_connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY employees ({', '.join(EMPLOYEE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def insert_employees(db: Session, rows: List[dict]):
+    """Insert rows as batched multi-row INSERTs"""
+    db.execute(insert(Employee.__table__), rows)
+
+
+def write_chunks(db: Session, rows: List[dict], chunk_size: int = UPLOAD_CHUNK_SIZE, method: str = UPLOAD_METHOD,
+                 first_chunk: int = 1):
+    """
+    Write employee rows chunk by chunk, each inside a SAVEPOINT.
+    Returns one status dict per chunk; failed chunks are rolled back
+    and carry an `error` instead of aborting the whole import.
+    """
+    if method == "copy" and not _copy_supported(db):
+        method = "insert"
+    write = copy_employees if method == "copy" else insert_employees
+    # New rows get ids above this, which bounds the path refresh below
+    last_id = db.execute(text("SELECT COALESCE(max(id), 0) FROM employees")).scalar()
+
+    chunks = []
+    for number, start in enumerate(range(0, len(rows), chunk_size), start=first_chunk):
+        chunk = rows[start:start + chunk_size]
+        status = {"chunk": number, "rows": len(chunk), "inserted": 0, "error": None}
+        try:
+            with db.begin_nested():
+                write(db, chunk)
+            status["inserted"] = len(chunk)
+            logger.info("Imported chunk %d (%d rows) via %s", number, len(chunk), method)
+        except Exception as e:
+            status["error"] = (str(e).splitlines() or [type(e).__name__])[0]
+            logger.warning("Chunk %d failed: %s", number, status["error"])
+        chunks.append(status)
+
+    # Paths for the new rows are filled in one statement rather than per row
+    refresh_missing_paths(db, after_id=last_id)
+    return chunks
+
+
+def import_employees(db: Session, items, chunk_size: int = UPLOAD_CHUNK_SIZE, method: str = UPLOAD_METHOD,
+                     first_chunk: int = 1):
+    """
+    Import validated EmployeeCreate items. Each item names its manager by
+    manager_id, or by manager_name / path[0] to find or create.
+    """
+    def manager_name_of(item):
+        return item.manager_name or (item.path[0] if item.path else None)
+
+    manager_ids = resolve_managers(
+        db, (manager_name_of(item) for item in items if item.manager_id is None and manager_name_of(item))
+    )
+
+    rows = [{
+        "name": item.name,
+        "email": item.email,
+        "role": item.role,
+        "manager_id": item.manager_id if item.manager_id is not None else manager_ids.get(manager_name_of(item)),
+        "country": item.country,
+        "snippet": item.snippet
+    } for item in items]
+
+    return write_chunks(db, rows, chunk_size, method, first_chunk)
+
+
+def _complete_csv_records(text_buffer: str) -> Tuple[List[str], str]:
+    """
+    Split buffered CSV text into complete records and the unfinished tail.
+    A line break ends a record only when the quotes seen so far are
+    balanced, so quoted fields may contain newlines.
+    """
+    records = []
+    current = ""
+    for line in text_buffer.splitlines(keepends=True):
+        current += line
+        if line.endswith(("\n", "\r")) and current.count('"') % 2 == 0:
+            records.append(current)
+            current = ""
+    return records, current
+
+
+async def iter_records(chunks: AsyncIterator[bytes], fmt: str,
+                       max_record_length: int = UPLOAD_MAX_RECORD_LENGTH) -> AsyncIterator[Tuple[int, object]]:
+    """
+    Parse an uploaded CSV (with a header row) or NDJSON body as it arrives.
+    Yields (row number, dict) per record, or (row number, ValueError) for
+    records that cannot be parsed. Only one partial record is buffered; a
+    record growing past max_record_length is reported as an error and the
+    rest of it, up to the next line break, is skipped.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    skipping = False
+    header = None
+    row_number = 0
+
+    def parse(records):
+        nonlocal header, row_number
+        if fmt == "csv":
+            for values in csv.reader(records):
+                if header is None:
+                    header = [name.strip() for name in values]
+                    continue
+                if not any(values):
+                    continue
+                row_number += 1
+                if len(values) != len(header):
+                    yield row_number, ValueError(f"expected {len(header)} columns, got {len(values)}")
+                    continue
+                # Empty CSV cells mean "not provided"
+                yield row_number, {key: value for key, value in zip(header, values) if value != ""}
+        else:
+            for line in records:
+                if not line.strip():
+                    continue
+                row_number += 1
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield row_number, ValueError(f"invalid JSON: {e}")
+                    continue
+                if not isinstance(record, dict):
+                    yield row_number, ValueError(f"expected a JSON object, got {type(record).__name__}")
+                    continue
+                yield row_number, record
+
+    def split(text_buffer, final=False):
+        if final:
+            return [text_buffer] if text_buffer.strip() else [], ""
+        if fmt == "csv":
+            return _complete_csv_records(text_buffer)
+        lines = text_buffer.split("\n")
+        return lines[:-1], lines[-1]
+
+    async for chunk in chunks:
+        text_buffer = decoder.decode(chunk)
+        if skipping:
+            line_end = text_buffer.find("\n")
+            if line_end < 0:
+                continue
+            text_buffer, skipping = text_buffer[line_end + 1:], False
+        records, pending = split(pending + text_buffer)
+        for item in parse(records):
+            yield item
+        if len(pending) > max_record_length:
+            row_number += 1
+            yield row_number, ValueError(f"record is longer than {max_record_length} characters")
+            pending, skipping = "", True
+
+    records, pending = split(pending + decoder.decode(b"", final=True), final=True)
+    for item in parse(records):
+        yield item
@@ -0,0 +1,213 @@
+"""
+Push feed of employee, manager and annotation changes (/api/changes/stream).
+
+Handlers call record_change(db, ...) next to the write; the change is only
+published once that session commits, and dropped if it rolls back. Two
+backends, picked with CHANGE_FEED_BACKEND:
+
+  memory    (default) committed changes go straight to this process's
+            broker; enough for one worker and for tests.
+  postgres  changes are sent with pg_notify() inside the committing
+            transaction, and listen() relays the CHANGE_FEED_CHANNEL
+            notifications, from every worker, into the local broker.
+            Event ids come from the change_feed_seq database sequence,
+            so a Last-Event-ID means the same thing on every worker.
+
+Subscribers get events as dicts {"id", "entity", "op", "ids", "data"}.
+The broker keeps the last CHANGE_FEED_HISTORY events so a reconnecting
+client can resume from its Last-Event-ID, and a subscriber that falls
+CHANGE_FEED_QUEUE_SIZE events behind receives {"op": "resync"} (refetch
+everything) instead of blocking publishers.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+from collections import deque
+from typing import Any, List, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from metrics import GaugeCallback
+
+logger = logging.getLogger(__name__)
+
+CHANGE_FEED_BACKEND = os.getenv("CHANGE_FEED_BACKEND", "memory")
+CHANGE_FEED_CHANNEL = os.getenv("CHANGE_FEED_CHANNEL", "org_changes")
+CHANGE_FEED_HISTORY = int(os.getenv("CHANGE_FEED_HISTORY", "1000"))
+CHANGE_FEED_QUEUE_SIZE = int(os.getenv("CHANGE_FEED_QUEUE_SIZE", "1000"))
+# Postgres sequence numbering events with the postgres backend (see models.py)
+CHANGE_FEED_SEQUENCE = "change_feed_seq"
+
+# pg_notify payloads must stay under 8000 bytes; bigger changes are sent without `data`
+NOTIFY_MAX_BYTES = 7900
+
+
+class ChangeBroker:
+    """Fans committed changes out to asyncio subscribers; publish() is thread-safe"""
+
+    def __init__(self, history: int = CHANGE_FEED_HISTORY, queue_size: int = CHANGE_FEED_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._history = deque(maxlen=history)
+        self._sequence = itertools.count(1)
+        self._subscribers = set()
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback):
+        """Call `callback(change)` synchronously for every change, e.g. to invalidate caches"""
+        self._listeners.append(callback)
+
+    def notify_listeners(self, change: dict):
+        for callback in self._listeners:
+            try:
+                callback(change)
+            except Exception:
+                logger.exception("Change listener %r failed", callback)
+
+    def publish(self, change: dict):
+        """Publish a change; changes relayed from Postgres already carry their id"""
+        with self._lock:
+            if "id" not in change:
+                change = {"id": next(self._sequence), **change}
+            self._history.append(change)
+            subscribers = list(self._subscribers)
+        self.notify_listeners(change)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._offer, queue, change)
+
+    def _offer(self, queue: asyncio.Queue, change: dict):
+        if queue.full():
+            # Too far behind to catch up incrementally: tell the client to refetch
+            while not queue.empty():
+                queue.get_nowait()
+            change = {"id": change["id"], "op": "resync"}
+        queue.put_nowait(change)
+
+    def subscribe(self, last_event_id: Optional[int] = None):
+        """Register a queue on the running loop; replays history after `last_event_id`"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            if last_event_id is not None:
+                missed = [change for change in self._history if change["id"] > last_event_id]
+                # Relayed ids arrive in commit order, which may differ from sequence order
+                ids = [change["id"] for change in self._history]
+                latest = max(ids, default=0)
+                if (ids and min(ids) > last_event_id + 1) or last_event_id > latest:
+                    # Part of what the client missed has left the history, or the id is from before a restart
+                    missed = [{"id": latest, "op": "resync"}]
+                elif len(missed) > self.queue_size:
+                    # More than the queue holds: replaying only the tail would silently drop the rest
+                    missed = [{"id": latest, "op": "resync"}]
+                for change in missed:
+                    queue.put_nowait(change)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+
+broker = ChangeBroker()
+
+GaugeCallback("change_feed_subscribers", "Open change feed streams in this process",
+              lambda: [({}, broker.subscriber_count())])
+
+
+def record_change(db: Session, entity: str, op: str, ids: List[int], data: Any = None):
+    """Queue a change on the session; it is published if and when the session commits"""
+    db.info.setdefault("pending_changes", []).append({"entity": entity, "op": op, "ids": list(ids), "data": data})
+
+
+# One statement for every change of a commit, in order; ids are drawn from
+# the shared sequence in the same statement
+NOTIFY_SQL = text(f"""
+    SELECT pg_notify(:channel, jsonb_set(change, '{{id}}', to_jsonb(nextval('{CHANGE_FEED_SEQUENCE}')))::text)
+    FROM jsonb_array_elements(CAST(:payloads AS jsonb)) AS changes (change)
+""")
+
+
+def _payload(change: dict) -> str:
+    payload = json.dumps(change, separators=(",", ":"), default=str)
+    if len(payload.encode()) > NOTIFY_MAX_BYTES:
+        payload = json.dumps({**change, "data": None}, separators=(",", ":"))
+    if len(payload.encode()) > NOTIFY_MAX_BYTES:
+        # Too many ids (e.g. a bulk reorg): have clients refetch instead
+        payload = json.dumps({"entity": change["entity"], "op": "resync"}, separators=(",", ":"))
+    return payload
+
+
+@event.listens_for(Session, "before_commit")
+def _notify_before_commit(session: Session):
+    # NOTIFY is transactional: Postgres delivers it only if this commit succeeds
+    if CHANGE_FEED_BACKEND != "postgres" or not session.info.get("pending_changes"):
+        return
+    payloads = "[" + ",".join(_payload(change) for change in session.info["pending_changes"]) + "]"
+    # Feed bookkeeping, not the handler's work: kept out of query budgets
+    session.execute(NOTIFY_SQL, {"channel": CHANGE_FEED_CHANNEL, "payloads": payloads},
+                    execution_options={"query_profile": False})
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session: Session):
+    for change in session.info.pop("pending_changes", None) or ():
+        if CHANGE_FEED_BACKEND == "postgres":
+            # The NOTIFY round trip publishes it; local listeners (caches) shouldn't wait for that
+            broker.notify_listeners(change)
+        else:
+            broker.publish(change)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session):
+    session.info.pop("pending_changes", None)
+
+
+async def listen(dsn: str):
+    """
+    Relay CHANGE_FEED_CHANNEL notifications into the broker until
+    cancelled, reconnecting after connection loss. Postgres backend only.
+    """
+    import asyncpg
+
+    def relay(connection, pid, channel, payload):
+        try:
+            broker.publish(json.loads(payload))
+        except ValueError:
+            logger.warning("Ignoring malformed change notification: %.200s", payload)
+
+    dsn = dsn.replace("postgresql+psycopg2://", "postgresql://", 1)
+    disconnected = False
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(dsn)
+            await connection.add_listener(CHANGE_FEED_CHANNEL, relay)
+            logger.info("Listening for changes on %s", CHANGE_FEED_CHANNEL)
+            if disconnected:
+                # Notifications sent while disconnected are lost; have clients refetch. Numbered
+                # after every change sent so far, so a client resuming from any of them replays it.
+                resync_id = await connection.fetchval(f"SELECT last_value FROM {CHANGE_FEED_SEQUENCE}")
+                broker.publish({"id": resync_id, "op": "resync"})
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda _: closed.set())
+            await closed.wait()
+            disconnected = True
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            disconnected = True
+            logger.exception("Change feed listener failed; retrying in 5s")
+            await asyncio.sleep(5)
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
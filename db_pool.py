@@ -0,0 +1,57 @@
+"""
+Connection pool settings and instrumentation shared by database.py,
+async_database.py and wellcome/database.py. Only reads the environment
+and defines classes, so importing it creates no engine.
+"""
+
+import os
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from metrics import Histogram
+
+POOL_OPTIONS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    # Recycle before Postgres/pgbouncer idle timeouts close connections under us
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    # Test connections on checkout so a failover doesn't surface as request errors
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+    # LIFO lets surplus connections sit idle and expire after a burst
+    "pool_use_lifo": os.getenv("DB_POOL_USE_LIFO", "true").lower() in ("1", "true", "yes"),
+}
+CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    wait_seconds = Histogram()
+    timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            type(self).timeouts += 1
+            raise
+        finally:
+            self.wait_seconds.observe(time.perf_counter() - started)
+
+
+def pool_stats(engine, pool_class) -> dict:
+    """Live counters for an engine's pool plus its checkout wait histogram"""
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": POOL_OPTIONS["max_overflow"],
+        "timeouts": pool_class.timeouts,
+        "wait_seconds": pool_class.wait_seconds.snapshot()
+    }
@@ -0,0 +1,134 @@
+"""
+Conditional and byte-range file responses for /api/pdf/{document}.
+ETags come from the file's size and mtime, so a revalidation costs one
+stat() and returns 304 without opening the file. Bodies are streamed
+from a read-only mmap in fixed-size memoryview slices, which the server
+writes to the socket without copying them through a read buffer; the
+kernel pages the file in on demand, so a Range request for a few pages
+of a large document only touches those pages. file_response() puts
+these together into the response for one request.
+"""
+
+import mmap
+import os
+import re
+from email.utils import formatdate
+from typing import Iterator, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+STREAM_CHUNK_SIZE = int(os.getenv("PDF_STREAM_CHUNK_SIZE", str(256 * 1024)))
+
+_RANGE_RE = re.compile(r"^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$")
+
+
+class RangeNotSatisfiable(ValueError):
+    """The Range header asks for bytes outside the file"""
+
+
+def etag_for(stat: os.stat_result) -> str:
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def last_modified(stat: os.stat_result) -> str:
+    return formatdate(stat.st_mtime, usegmt=True)
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match comparison (weak, so W/ prefixes are ignored)"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Inclusive (start, end) for a single `bytes=` range, or None to send
+    the whole file (no header, or a multi-range, unknown unit or invalid
+    range, which RFC 9110 says to ignore). Raises RangeNotSatisfiable
+    when the range lies outside the file.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header)
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable(header)
+        return max(0, size - length), size - 1
+
+    start = int(first)
+    if last and int(last) < start:
+        # bytes=9-3 is syntactically invalid rather than unsatisfiable
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def iter_file_range(path: str, start: int, end: int, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[memoryview]:
+    """Yield bytes start..end (inclusive) of a file as slices of a read-only mmap"""
+    if end < start:
+        return
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mapped, "madvise"):
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+    # Not closed explicitly: the server may still hold the last slices, and
+    # the mapping is released once they are garbage collected
+    view = memoryview(mapped)
+    for offset in range(start, end + 1, chunk_size):
+        yield view[offset:min(offset + chunk_size, end + 1)]
+
+
+def file_response(request: Request, path: str, media_type: str, cache_control: str) -> Response:
+    """
+    Response for a GET or HEAD of `path`: 304 when If-None-Match matches,
+    206 for a single satisfiable Range (unless If-Range names another
+    version), 416 when the range lies outside the file, 200 otherwise.
+    """
+    stat = os.stat(path)
+    headers = {
+        "ETag": etag_for(stat),
+        "Last-Modified": last_modified(stat),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": cache_control,
+    }
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    size = stat.st_size
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range.strip() not in (headers["ETag"], headers["Last-Modified"]):
+        # The client's copy is stale: send the whole current file instead of a slice of it
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    status_code = 200
+    start, end = 0, size - 1
+    if byte_range is not None:
+        status_code = 206
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(
+        iter_file_range(path, start, end), status_code=status_code, headers=headers, media_type=media_type
+    )
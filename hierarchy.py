@@ -0,0 +1,215 @@
+"""
+Org hierarchy: materialized paths and recursive reporting-chain queries.
+
+Managers report to managers through managers.manager_id, and employees to
+a manager through employees.manager_id, so a chain can be any depth.
+Every employee row stores its full path (top manager ... direct manager,
+then its own name) in employees.path, so /org-chart and /api/search
+select it directly instead of walking the chain on each request. The
+refresh helpers recompute stored paths with one set-based UPDATE and must
+be called by any handler that changes an employee's name or manager, or a
+manager's name or manager, before it commits.
+
+subtree() and chain_of_command() answer "everyone under X" and "who is
+above Y" with recursive CTEs that walk ix_managers_manager_id downwards
+and the primary keys upwards, one index probe per node. Recursion stops
+after HIERARCHY_MAX_DEPTH levels, which also bounds any accidental cycle.
+"""
+
+import os
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Deepest reporting chain followed by any recursive query
+HIERARCHY_MAX_DEPTH = int(os.getenv("HIERARCHY_MAX_DEPTH", "64"))
+
+
+def _names_from_top(first_manager_id: str) -> str:
+    """varchar[] of manager `first_manager_id` and everyone above it, top of the org first"""
+    return f"""ARRAY(
+        WITH RECURSIVE chain(id, name, manager_id, depth) AS (
+            SELECT up.id, up.name, up.manager_id, 1 FROM managers up WHERE up.id = {first_manager_id}
+            UNION ALL
+            SELECT up.id, up.name, up.manager_id, c.depth + 1
+            FROM managers up JOIN chain c ON up.id = c.manager_id
+            WHERE c.depth < {HIERARCHY_MAX_DEPTH}
+        )
+        SELECT name FROM chain ORDER BY depth DESC
+    )::varchar[]"""
+
+
+# Path of the employee aliased as `e`: its managers from the top down, then its own name
+PATH_SQL = f"{_names_from_top('e.manager_id')} || e.name"
+
+# Path of the manager aliased as `m`, ending with its own name; its direct reports' paths extend it
+MANAGER_PATH_SQL = _names_from_top("m.id")
+
+# Ids of manager :manager_id and every manager below it
+MANAGER_SUBTREE_SQL = f"""
+    WITH RECURSIVE subtree(id, depth) AS (
+        SELECT CAST(:manager_id AS integer), 0
+        UNION ALL
+        SELECT m.id, s.depth + 1
+        FROM managers m JOIN subtree s ON m.manager_id = s.id
+        WHERE s.depth < {HIERARCHY_MAX_DEPTH}
+    )
+    SELECT id FROM subtree
+"""
+
+# Managers and employees under :manager_id down to :max_depth; direct reports are depth 1
+SUBTREE_SQL = text("""
+    WITH RECURSIVE subtree(id, depth) AS (
+        SELECT m.id, 0 FROM managers m WHERE m.id = :manager_id
+        UNION ALL
+        SELECT m.id, s.depth + 1
+        FROM managers m JOIN subtree s ON m.manager_id = s.id
+        WHERE s.depth < :max_depth
+    )
+    SELECT * FROM (
+        SELECT 'manager' AS kind, m.id, m.name, m.email, m.role, m.manager_id, s.depth
+        FROM subtree s JOIN managers m ON m.id = s.id
+        WHERE s.depth > 0
+        UNION ALL
+        SELECT 'employee' AS kind, e.id, e.name, e.email, e.role, e.manager_id, s.depth + 1
+        FROM subtree s JOIN employees e ON e.manager_id = s.id
+        WHERE s.depth < :max_depth
+    ) reports
+    ORDER BY depth, kind, id
+    LIMIT :limit
+""")
+
+# Managers above :employee_id (or above manager :manager_id), nearest first
+CHAIN_OF_COMMAND_SQL = text(f"""
+    WITH RECURSIVE chain(id, name, email, role, manager_id, depth) AS (
+        SELECT m.id, m.name, m.email, m.role, m.manager_id, 1
+        FROM managers m
+        WHERE m.id = COALESCE(
+            (SELECT e.manager_id FROM employees e WHERE e.id = :employee_id),
+            (SELECT own.manager_id FROM managers own WHERE own.id = :manager_id)
+        )
+        UNION ALL
+        SELECT m.id, m.name, m.email, m.role, m.manager_id, c.depth + 1
+        FROM managers m JOIN chain c ON m.id = c.manager_id
+        WHERE c.depth < {HIERARCHY_MAX_DEPTH}
+    )
+    SELECT id, name, email, role, manager_id, depth FROM chain ORDER BY depth
+""")
+
+
+MANAGER_PATHS_SQL = text(f"SELECT m.id, {MANAGER_PATH_SQL} AS path FROM managers m WHERE m.id = ANY(:ids)")
+
+# Reassign employees and give them their new path in the same statement
+MOVE_EMPLOYEES_SQL = text(f"""
+    UPDATE employees e
+    SET manager_id = target.id, path = target.path || e.name
+    FROM (SELECT m.id, {MANAGER_PATH_SQL} AS path FROM managers m WHERE m.id = :manager_id) target
+    WHERE e.id = ANY(:employee_ids)
+    RETURNING e.id
+""")
+
+
+def subtree(db: Session, manager_id: int, depth: Optional[int] = None, limit: int = 10000) -> List[dict]:
+    """Everyone reporting to a manager, directly or not, down to `depth` levels"""
+    max_depth = min(depth or HIERARCHY_MAX_DEPTH, HIERARCHY_MAX_DEPTH)
+    rows = db.execute(SUBTREE_SQL, {"manager_id": manager_id, "max_depth": max_depth, "limit": limit})
+    return [dict(row) for row in rows.mappings()]
+
+
+def chain_of_command(db: Session, employee_id: Optional[int] = None, manager_id: Optional[int] = None) -> List[dict]:
+    """Managers above an employee (or above a manager), from the direct manager up to the top"""
+    rows = db.execute(CHAIN_OF_COMMAND_SQL, {"employee_id": employee_id, "manager_id": manager_id})
+    return [dict(row) for row in rows.mappings()]
+
+
+def refresh_employee_paths(db: Session, employee_ids: Iterable[int]) -> int:
+    """Recompute the stored path of the given employees"""
+    ids = list(employee_ids)
+    if not ids:
+        return 0
+    db.flush()
+    result = db.execute(text(f"UPDATE employees e SET path = {PATH_SQL} WHERE e.id = ANY(:ids)"), {"ids": ids})
+    return result.rowcount
+
+
+def refresh_manager_paths(db: Session, manager_id: int) -> int:
+    """Recompute the stored path of everyone under a manager, at any depth"""
+    db.flush()
+    result = db.execute(
+        text(f"UPDATE employees e SET path = {PATH_SQL} WHERE e.manager_id IN ({MANAGER_SUBTREE_SQL})"),
+        {"manager_id": manager_id}
+    )
+    return result.rowcount
+
+
+def rename_in_paths(db: Session, manager_id: int, position: int, name: str) -> int:
+    """
+    After renaming a manager, write its new name at `position` (1-based,
+    its depth from the top) in the path of everyone under it. Cheaper than
+    refresh_manager_paths() because nothing above the manager changed.
+    """
+    db.flush()
+    result = db.execute(
+        text(f"UPDATE employees e SET path[CAST(:position AS integer)] = :name "
+             f"WHERE e.manager_id IN ({MANAGER_SUBTREE_SQL})"),
+        {"manager_id": manager_id, "position": position, "name": name}
+    )
+    return result.rowcount
+
+
+def manager_paths(db: Session, manager_ids: Iterable[int]) -> Dict[int, List[str]]:
+    """Current path of each existing manager, keyed by id"""
+    rows = db.execute(MANAGER_PATHS_SQL, {"ids": list(manager_ids)})
+    return {row.id: list(row.path) for row in rows}
+
+
+def move_employees(db: Session, employee_ids: Iterable[int], manager_id: int) -> List[int]:
+    """Make employees report to `manager_id`, paths included, in one UPDATE; returns the ids moved"""
+    db.flush()
+    rows = db.execute(MOVE_EMPLOYEES_SQL, {"employee_ids": list(employee_ids), "manager_id": manager_id})
+    return [row.id for row in rows]
+
+
+def merge_managers(db: Session, source_id: int, target_id: int, source_path: List[str], target_path: List[str]) -> int:
+    """
+    Fold manager `source_id` into `target_id`: its employees and the
+    managers reporting to it move to the target, and the source row is
+    deleted. Paths under the source keep their tail and swap the source
+    prefix for the target's. Returns the number of employees whose path
+    changed. The caller checks that the target is not under the source.
+    """
+    db.flush()
+    moved = db.execute(text(f"""
+        UPDATE employees e
+        SET path = CAST(:target_path AS varchar[]) || e.path[(:start) : array_upper(e.path, 1)],
+            manager_id = CASE WHEN e.manager_id = :manager_id THEN :target_id ELSE e.manager_id END
+        WHERE e.manager_id IN ({MANAGER_SUBTREE_SQL})
+    """), {
+        "manager_id": source_id, "target_id": target_id,
+        "target_path": target_path, "start": len(source_path) + 1,
+    }).rowcount
+    db.execute(text("UPDATE managers SET manager_id = :target_id WHERE manager_id = :source_id"),
+               {"source_id": source_id, "target_id": target_id})
+    db.execute(text("DELETE FROM managers WHERE id = :source_id"), {"source_id": source_id})
+    return moved
+
+
+def refresh_all_paths(db: Session) -> int:
+    """Recompute every stored path, e.g. after a bulk import"""
+    db.flush()
+    return db.execute(text(f"UPDATE employees e SET path = {PATH_SQL}")).rowcount
+
+
+def refresh_missing_paths(db: Session, after_id: int = 0) -> int:
+    """
+    Fill in paths for rows written without one, e.g. by a bulk COPY.
+    Only rows with id > after_id are considered, so passing the highest
+    id from before the write keeps this a primary key range scan over the
+    new rows instead of a scan of the whole table.
+    """
+    db.flush()
+    return db.execute(
+        text(f"UPDATE employees e SET path = {PATH_SQL} WHERE e.id > :after_id AND e.path IS NULL"),
+        {"after_id": after_id}
+    ).rowcount
@@ -0,0 +1,143 @@
+"""
+Per-route request metrics for the /metrics endpoint.
+MetricsMiddleware times every HTTP request and records its size and
+status under the matched route template. instrument_engine() hooks
+SQLAlchemy cursor events, so each request's query count and DB time are
+attributed to the same route, and instrument_pool() adds connection
+pool gauges.
+"""
+
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+from metrics import REGISTRY, Counter, GaugeCallback, HistogramFamily, histogram_samples
+
+# Byte-size buckets, 100B to 10MB
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 500)
+
+REQUEST_SECONDS = HistogramFamily(
+    "http_request_duration_seconds", "Time to serve a request, including streamed bodies", ("method", "route"))
+REQUESTS_TOTAL = Counter(
+    "http_requests_total", "Requests served, by status code", ("method", "route", "status"))
+REQUEST_BYTES = HistogramFamily(
+    "http_request_size_bytes", "Request body size", ("method", "route"), buckets=SIZE_BUCKETS)
+RESPONSE_BYTES = HistogramFamily(
+    "http_response_size_bytes", "Response body size", ("method", "route"), buckets=SIZE_BUCKETS)
+REQUEST_DB_QUERIES = HistogramFamily(
+    "http_request_db_queries", "SQL statements executed per request", ("method", "route"), buckets=QUERY_COUNT_BUCKETS)
+REQUEST_DB_SECONDS = HistogramFamily(
+    "http_request_db_seconds", "Time spent in SQL statements per request", ("method", "route"))
+
+
+class RequestStats:
+    """Database work done on behalf of one request"""
+
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# Sync handlers run with a copy of the request's context, so they share this object
+request_stats_var: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def instrument_engine(engine):
+    """Attribute every statement run on `engine` to the current request"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        stats = request_stats_var.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # after_cursor_execute never fires for a failed statement
+        if context.connection is not None and context.connection.info.get("query_started"):
+            context.connection.info["query_started"].pop()
+
+
+# (engine label, engine, pool class) for every pool exported on /metrics
+_POOLS = []
+
+
+def instrument_pool(label: str, engine, pool_class):
+    """Export an engine's pool gauges and checkout wait histogram (see db_pool.pool_stats)"""
+    _POOLS.append((label, engine, pool_class))
+
+
+class _PoolWaitSeconds:
+    type = "histogram"
+    name = "db_pool_wait_seconds"
+    documentation = "Time spent waiting to check a connection out of the pool"
+
+    def samples(self):
+        for label, _, pool_class in _POOLS:
+            yield from histogram_samples(self.name, {"engine": label}, pool_class.wait_seconds)
+
+
+GaugeCallback("db_pool_checked_out", "Connections currently checked out",
+              lambda: [({"engine": label}, engine.pool.checkedout()) for label, engine, _ in _POOLS])
+GaugeCallback("db_pool_overflow", "Connections open beyond pool_size (negative while below it)",
+              lambda: [({"engine": label}, engine.pool.overflow()) for label, engine, _ in _POOLS])
+GaugeCallback("db_pool_timeouts", "Checkouts that gave up after pool_timeout",
+              lambda: [({"engine": label}, pool_class.timeouts) for label, _, pool_class in _POOLS])
+REGISTRY.append(_PoolWaitSeconds())
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, sizes, status and DB work per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = request_stats_var.set(stats)
+        started = time.perf_counter()
+        request_bytes = 0
+        response_bytes = 0
+        status = 500
+
+        async def counting_receive():
+            nonlocal request_bytes
+            message = await receive()
+            request_bytes += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal response_bytes, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            request_stats_var.reset(token)
+            # The router stores the matched route on the scope; label by its template
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            labels = {"method": scope["method"], "route": route}
+            REQUEST_SECONDS.observe(time.perf_counter() - started, **labels)
+            REQUESTS_TOTAL.inc(status=status, **labels)
+            REQUEST_BYTES.observe(request_bytes, **labels)
+            RESPONSE_BYTES.observe(response_bytes, **labels)
+            REQUEST_DB_QUERIES.observe(stats.queries, **labels)
+            REQUEST_DB_SECONDS.observe(stats.db_seconds, **labels)
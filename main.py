@@ -1,22 +1,87 @@
 # Backup Balaji's code
 
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Body, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from database import SessionLocal, engine
-from models import Base, Manager, Employee
+from database import DATABASE_URL, DB_MODE, SessionLocal, engine
+from db_pool import TimedQueuePool, pool_stats
+from models import ANNOTATION_BOX_SQL, ANNOTATION_COMPLETE_SQL, Base, Manager, Employee
 import models
 # from routers import employees
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, ValidationError
 from typing import List, Optional
 from sqlalchemy import text
 from typing import Any
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager, suppress
+from ag_grid import block_response, build_grid_query
+from annotation_store import SaveCoalescer, VersionConflict, format_etag, parse_if_match, write_annotations
+from async_routes import io_bound
+from change_feed import CHANGE_FEED_BACKEND, broker, listen, record_change
+from bulk_import import UPLOAD_CHUNK_SIZE, UPLOAD_METHOD, import_employees, iter_records
+from hierarchy import (
+    HIERARCHY_MAX_DEPTH,
+    chain_of_command,
+    manager_paths,
+    merge_managers,
+    move_employees,
+    refresh_employee_paths,
+    refresh_manager_paths,
+    rename_in_paths,
+    subtree,
+)
+from json_patch import JsonPatchError, apply_patch, merge_patch
+from instrumentation import MetricsMiddleware, instrument_engine, instrument_pool
+from logging_config import RequestIdMiddleware, setup_logging
+from file_serving import etag_matches, file_response
+from metrics import render_prometheus
+from overlay import MEDIA_TYPES, compress, encode_overlay
+from pdf_text import PDF_DEFAULT_DOCUMENT, get_page, resolve_document, snippet_for
+import query_profiler
+from query_profiler import QueryProfilerMiddleware, query_budget
+from response_cache import RESPONSE_CACHE
+from serialization import FastJSONResponse, RowEncoder, dumps
+from search import (
+    SEARCH_RESULT_CAP,
+    STREAM_BATCH_SIZE,
+    build_ranked_search_query,
+    build_search_query,
+    encode_cursor,
+    next_cursor,
+)
 
+# Largest page a client may request from /api/search
+SEARCH_MAX_PAGE_SIZE = 5000
+# Cache-Control for /api/pdf/{document}; "no-cache" makes browsers revalidate and get a 304
+PDF_CACHE_CONTROL = os.getenv("PDF_CACHE_CONTROL", "no-cache")
+
+setup_logging()
+logger = logging.getLogger(__name__)
 
 
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # With the postgres change feed, every worker relays NOTIFYs into its own broker
+    listener = asyncio.create_task(listen(DATABASE_URL)) if CHANGE_FEED_BACKEND == "postgres" else None
+    yield
+    if listener is not None:
+        listener.cancel()
+        with suppress(asyncio.CancelledError):
+            await listener
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+# Committed writes (via record_change) drop the cached responses they affect
+broker.add_listener(RESPONSE_CACHE.invalidate_change)
 
 origins = [
     "http://localhost:3000",  
@@ -32,7 +97,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Request-ID"],
 )
+app.add_middleware(RequestIdMiddleware)
+app.add_middleware(MetricsMiddleware)
+if query_profiler.ENABLED:
+    app.add_middleware(QueryProfilerMiddleware)
+
+instrument_engine(engine)
+instrument_pool("sync", engine, TimedQueuePool)
+if DB_MODE == "async":
+    from async_database import TimedAsyncQueuePool, async_engine
+    instrument_engine(async_engine.sync_engine)
+    instrument_pool("async", async_engine.sync_engine, TimedAsyncQueuePool)
 
 @app.get("/")
 def root():
@@ -80,7 +157,10 @@ class EmployeeCreate(BaseModel):
     name: str
     email: str
     role: str
-    manager_id: int
+    # Either an existing manager_id, or a manager_name / path[0] to find or create
+    manager_id: Optional[int] = None
+    manager_name: Optional[str] = None
+    path: Optional[List[str]] = None
     country: str = "India"
     snippet: Optional[str] = None
     
@@ -109,9 +189,31 @@ class AnnotationResponse(BaseModel):
     has_annotation: bool
     coordinates: Optional[AnnotationCoordinates] = None
     
+# Most employees one batch annotation request may touch
+ANNOTATION_BATCH_MAX = 1000
+
+class AnnotationBatchRequest(BaseModel):
+    employee_ids: List[int] = Field(..., min_length=1, max_length=ANNOTATION_BATCH_MAX)
+
+class AnnotationBatchItem(AnnotationCoordinates):
+    employee_id: int
+
+class AnnotationBatchUpsertRequest(BaseModel):
+    items: List[AnnotationBatchItem] = Field(..., min_length=1, max_length=ANNOTATION_BATCH_MAX)
+
+# Most employees one reassignment may move
+REASSIGN_MAX = 50000
+
+class ReassignRequest(BaseModel):
+    employee_ids: List[int] = Field(..., min_length=1, max_length=REASSIGN_MAX)
+
+class MergeManagersRequest(BaseModel):
+    into: int  # Manager that takes over the reports
+
 class AnnotationSaveRequest(BaseModel):
     employee_id: int
     annotations: Any  
+    version: Optional[int] = None  # Revision the client last read; alternative to If-Match
     
 class MyModel(BaseModel):
     model_config = {
@@ -123,71 +225,110 @@ class MyModel(BaseModel):
 
 # Add search endpoint for frontend TreeGrid
 @app.get("/api/search")
-def search_employees(name: str = "", db: Session = Depends(get_db)):
-    """Search employees by name - used by TreeGrid component with hierarchy"""
-    print(f"🔍 Searching employees with name: '{name}'")
-    
-    # Get all managers and employees with their relationships
-    query = """
-    SELECT 
-        e.id,
-        e.name,
-        e.email,
-        e.role,
-        e.manager_id,
-        e.country,
-        e.x0,
-        e.x1,
-        e.y0,
-        e.y1,
-        e.page,
-        e.snippet,
-        m.name as manager_name,
-        ARRAY[m.name, e.name] as path
-    FROM employees e
-    LEFT JOIN managers m ON e.manager_id = m.id
+@query_budget(2)
+def search_employees(
+    request: Request,
+    name: str = "",
+    limit: Optional[int] = Query(None, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    db: Session = Depends(get_db)
+):
     """
-    
+    Search employees by name - used by TreeGrid component with hierarchy.
+    With a `name`, matches are ranked by similarity and capped at
+    SEARCH_RESULT_CAP rows (or `limit`, if smaller).
+    Without one, pass `limit` to page through all employees; the next
+    page's `cursor` is returned in the X-Next-Cursor header.
+    With `format=ndjson` (or an Accept: application/x-ndjson header) rows
+    are streamed one per line as the database cursor yields them, followed
+    by a {"next_cursor": ...} line when more pages remain.
+    """
+    logger.debug("Searching employees", extra={"search": name, "limit": limit, "cursor": cursor})
+
     if name:
-        query += " WHERE e.name ILIKE :name OR m.name ILIKE :name"
-        result = db.execute(text(query), {"name": f"%{name}%"})
+        if cursor:
+            raise HTTPException(status_code=400, detail="cursor cannot be combined with a name search")
+        query, params = build_ranked_search_query(name, limit or SEARCH_RESULT_CAP)
+        # Ranked results are capped rather than paged
+        limit = None
     else:
-        result = db.execute(text(query))
-    
-    # Convert to list of dictionaries
-    employees_data = []
-    for row in result:
-        employees_data.append({
-            "id": row.id,
-            "name": row.name,
-            "email": row.email,
-            "role": row.role,
-            "manager_id": row.manager_id,
-            "country": row.country,
-            "x0": row.x0,
-            "x1": row.x1,
-            "y0": row.y0,
-            "y1": row.y1,
-            "page": row.page,
-            "snippet": row.snippet,
-            "manager_name": row.manager_name,
-            "path": row.path
-        })
-    
-    print(f"📊 Found {len(employees_data)} employees with hierarchy")
-    return employees_data
+        try:
+            query, params = build_search_query(cursor, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "ndjson" or "application/x-ndjson" in request.headers.get("accept", ""):
+        return StreamingResponse(stream_search_rows(query, params, limit), media_type="application/x-ndjson")
+
+    result = db.execute(query, params)
+
+    # Encoded here rather than returned, which would send every row through jsonable_encoder
+    employees_data = RowEncoder(result.keys()).dicts(result)
+    cursor_token = next_cursor(employees_data, limit)
+    headers = {"X-Next-Cursor": cursor_token} if cursor_token else None
+
+    logger.info("Found %d employees with hierarchy", len(employees_data))
+    return FastJSONResponse(employees_data, headers=headers)
+
+
+def stream_search_rows(query, params, limit):
+    """Yield NDJSON chunks straight from a server-side cursor, one DB batch at a time"""
+    # The request session is closed once the handler returns, so the stream owns its own
+    db = SessionLocal()
+    try:
+        result = db.execute(query.execution_options(stream_results=True, yield_per=STREAM_BATCH_SIZE), params)
+        encoder = RowEncoder(result.keys())
+        sent = 0
+        last = None
+        for batch in result.partitions():
+            more = limit is not None and sent + len(batch) > limit
+            if more:
+                # Only the look-ahead row is left past the limit, so another page exists
+                batch = batch[:limit - sent]
+            chunk = encoder.encode_lines(batch)
+            sent += len(batch)
+            if batch:
+                last = batch[-1]
+            if more:
+                chunk += dumps({"next_cursor": encode_cursor(last.manager_id, last.id)}) + b"\n"
+            yield chunk
+            if more:
+                break
+    finally:
+        db.close()
     
 # ==== ANNOTATION MANAGEMENT APIs ====
 
+def annotation_delta(emp: Employee) -> dict:
+    """Change-feed payload for an employee's annotation rectangle"""
+    return {"x0": emp.x0, "x1": emp.x1, "y0": emp.y0, "y1": emp.y1, "page": emp.page, "snippet": emp.snippet}
+
+
+def employee_delta(emp: Employee) -> dict:
+    """Change-feed payload for an employee's editable fields (path is refreshed server-side)"""
+    return {"name": emp.name, "email": emp.email, "role": emp.role, "manager_id": emp.manager_id, "country": emp.country}
+
+
+def annotation_snippet(coordinates: AnnotationCoordinates, document: str) -> Optional[str]:
+    """Snippet under the rectangle from the PDF text layer; the client's snippet is the fallback"""
+    if any(value is None for value in (coordinates.x0, coordinates.x1, coordinates.y0, coordinates.y1, coordinates.page)):
+        return coordinates.snippet
+    return snippet_for(
+        document, coordinates.page, coordinates.x0, coordinates.y0, coordinates.x1, coordinates.y1
+    ) or coordinates.snippet
+
 # GET: Retrieve employee annotation coordinates
 @app.get("/employee/{employee_id}/annotation", response_model=AnnotationResponse)
-def get_employee_annotation(employee_id: int, db: Session = Depends(get_db)):
+@query_budget(1)
+def get_employee_annotation(employee_id: int, document: str = Query(PDF_DEFAULT_DOCUMENT), db: Session = Depends(get_db)):
     """
     GET /employee/{employee_id}/annotation
     Retrieves annotation coordinates for a specific employee.
-    Returns employee info and coordinates if annotation exists.
+    Returns employee info and coordinates if annotation exists; a missing
+    snippet is filled in from the document's text layer.
     """
-    print(f"🔍 GET annotation for employee {employee_id}")
+    logger.debug("GET annotation for employee %s", employee_id)
     
     emp = db.query(Employee).filter(Employee.id == employee_id).first()
     if not emp:
@@ -208,8 +349,10 @@ def get_employee_annotation(employee_id: int, db: Session = Depends(get_db)):
             x1=emp.x1,
             y0=emp.y0,
             y1=emp.y1,
-            page=emp.page
+            page=emp.page,
+            snippet=emp.snippet
         )
+        coordinates.snippet = coordinates.snippet or annotation_snippet(coordinates, document)
     
     response = AnnotationResponse(
         employee_id=emp.id,
@@ -218,18 +361,25 @@ def get_employee_annotation(employee_id: int, db: Session = Depends(get_db)):
         coordinates=coordinates
     )
     
-    print(f"✅ Retrieved annotation for {emp.name}: {has_annotation}")
+    logger.debug("Retrieved annotation for %s: %s", emp.name, has_annotation)
     return response
 
 # PUT: Update/Replace employee annotation coordinates
 @app.put("/employee/{employee_id}/annotation")
-def update_employee_annotation(employee_id: int, coordinates: AnnotationCoordinates, db: Session = Depends(get_db)):
+@query_budget(2)
+def update_employee_annotation(
+    employee_id: int,
+    coordinates: AnnotationCoordinates,
+    document: str = Query(PDF_DEFAULT_DOCUMENT),
+    db: Session = Depends(get_db)
+):
     """
     PUT /employee/{employee_id}/annotation
     Updates or replaces annotation coordinates for an employee.
-    If coordinates are null, removes the annotation.
+    If coordinates are null, removes the annotation. The snippet is taken
+    from the words of `document` under the rectangle.
     """
-    print(f"📝 PUT annotation for employee {employee_id}: {coordinates}")
+    logger.debug("PUT annotation for employee %s: %s", employee_id, coordinates)
     
     emp = db.query(Employee).filter(Employee.id == employee_id).first()
     if not emp:
@@ -241,12 +391,13 @@ def update_employee_annotation(employee_id: int, coordinates: AnnotationCoordina
     emp.y0 = coordinates.y0
     emp.y1 = coordinates.y1
     emp.page = coordinates.page
-    emp.snippet = coordinates.snippet
+    emp.snippet = annotation_snippet(coordinates, document)
+    record_change(db, "annotation", "update", [emp.id], annotation_delta(emp))
     
     db.commit()
     
     action = "cleared" if coordinates.x0 is None else "updated"
-    print(f"✅ Annotation {action} for {emp.name}")
+    logger.info("Annotation %s for employee %s", action, emp.id)
     
     return {
         "message": f"Annotation {action} successfully",
@@ -264,13 +415,19 @@ def update_employee_annotation(employee_id: int, coordinates: AnnotationCoordina
 
 # POST: Create new annotation (alternative to PUT)
 @app.post("/employee/{employee_id}/annotation")
-def create_employee_annotation(employee_id: int, coordinates: AnnotationCoordinates, db: Session = Depends(get_db)):
+@query_budget(2)
+def create_employee_annotation(
+    employee_id: int,
+    coordinates: AnnotationCoordinates,
+    document: str = Query(PDF_DEFAULT_DOCUMENT),
+    db: Session = Depends(get_db)
+):
     """
     POST /employee/{employee_id}/annotation
     Creates a new annotation for an employee (replaces existing if any).
     Same functionality as PUT but follows REST conventions for creation.
     """
-    print(f"➕ POST annotation for employee {employee_id}: {coordinates}")
+    logger.debug("POST annotation for employee %s: %s", employee_id, coordinates)
     
     emp = db.query(Employee).filter(Employee.id == employee_id).first()
     if not emp:
@@ -286,11 +443,12 @@ def create_employee_annotation(employee_id: int, coordinates: AnnotationCoordina
     emp.y0 = coordinates.y0
     emp.y1 = coordinates.y1
     emp.page = coordinates.page
-    emp.snippet = coordinates.snippet
+    emp.snippet = annotation_snippet(coordinates, document)
+    record_change(db, "annotation", "update", [emp.id], annotation_delta(emp))
     
     db.commit()
     
-    print(f"✅ Annotation created for {emp.name}")
+    logger.info("Annotation created for employee %s", emp.id)
     
     return {
         "message": "Annotation created successfully",
@@ -308,12 +466,14 @@ def create_employee_annotation(employee_id: int, coordinates: AnnotationCoordina
 
 # DELETE: Remove employee annotation
 @app.delete("/employee/{employee_id}/annotation")
+@io_bound
+@query_budget(2)
 def delete_employee_annotation(employee_id: int, db: Session = Depends(get_db)):
     """
     DELETE /employee/{employee_id}/annotation
     Removes annotation for an employee by setting coordinates to null.
     """
-    print(f"🗑️ DELETE annotation for employee {employee_id}")
+    logger.debug("DELETE annotation for employee %s", employee_id)
     
     emp = db.query(Employee).filter(Employee.id == employee_id).first()
     if not emp:
@@ -325,10 +485,11 @@ def delete_employee_annotation(employee_id: int, db: Session = Depends(get_db)):
     emp.y0 = None
     emp.y1 = None
     emp.page = None
+    record_change(db, "annotation", "delete", [emp.id])
     
     db.commit()
     
-    print(f"✅ Annotation deleted for {emp.name}")
+    logger.info("Annotation deleted for employee %s", emp.id)
     
     return {
         "message": "Annotation deleted successfully",
@@ -337,122 +498,296 @@ def delete_employee_annotation(employee_id: int, db: Session = Depends(get_db)):
     }    
     
 
-# ==== API ENDPOINTS ====
+# ---- Batch variants: one statement and one transaction for many employees ----
+
+ANNOTATION_UPSERT_SQL = text("""
+    UPDATE employees e
+    SET x0 = v.x0, x1 = v.x1, y0 = v.y0, y1 = v.y1, page = v.page, snippet = v.snippet
+    FROM unnest(
+        CAST(:ids AS integer[]), CAST(:x0 AS float8[]), CAST(:x1 AS float8[]),
+        CAST(:y0 AS float8[]), CAST(:y1 AS float8[]), CAST(:page AS integer[]), CAST(:snippet AS text[])
+    ) AS v(id, x0, x1, y0, y1, page, snippet)
+    WHERE e.id = v.id
+    RETURNING e.id
+""")
+
+ANNOTATION_CLEAR_SQL = text("""
+    UPDATE employees
+    SET x0 = NULL, x1 = NULL, y0 = NULL, y1 = NULL, page = NULL
+    WHERE id = ANY(:ids)
+    RETURNING id
+""")
+
+
+# POST: Read annotations of many employees
+@app.post("/employee/annotations/batch/get")
+@query_budget(1)
+def get_employee_annotations_batch(
+    data: AnnotationBatchRequest, document: str = Query(PDF_DEFAULT_DOCUMENT), db: Session = Depends(get_db)
+):
+    """
+    POST /employee/annotations/batch/get
+    Batch form of GET /employee/{id}/annotation. Returns one result per
+    requested id, in request order, with status "ok" or "not_found".
+    """
+    employees = {emp.id: emp for emp in db.query(Employee).filter(Employee.id.in_(data.employee_ids))}
+
+    results = []
+    for employee_id in data.employee_ids:
+        emp = employees.get(employee_id)
+        if emp is None:
+            results.append({"employee_id": employee_id, "status": "not_found"})
+            continue
+        coordinates = AnnotationCoordinates(x0=emp.x0, x1=emp.x1, y0=emp.y0, y1=emp.y1, page=emp.page, snippet=emp.snippet)
+        has_annotation = None not in (emp.x0, emp.x1, emp.y0, emp.y1, emp.page)
+        if has_annotation:
+            coordinates.snippet = coordinates.snippet or annotation_snippet(coordinates, document)
+        results.append({
+            "employee_id": emp.id,
+            "status": "ok",
+            "employee_name": emp.name,
+            "has_annotation": has_annotation,
+            "coordinates": coordinates if has_annotation else None
+        })
 
-# GET org chart for AG Grid Tree View
-from sqlalchemy import text
-from fastapi import Depends, Query
-from sqlalchemy.orm import Session
-from typing import List, Dict, Any
-import random
+    logger.debug("Batch GET annotations for %d employees", len(results))
+    return {"results": results}
 
 
-@app.get("/org-chart", response_model=List[Dict[str, Any]])
-def get_org_chart(db: Session = Depends(get_db)):
-    result = db.execute(text("""
-        SELECT emp.*, m.name AS manager_name, m.id AS manager_id
-        FROM employees emp
-        LEFT JOIN managers m ON emp.manager_id = m.id
-    """))
-    rows = result.fetchall()
+# POST: Create/replace annotations of many employees
+@app.post("/employee/annotations/batch/upsert")
+@query_budget(1)
+def upsert_employee_annotations_batch(
+    data: AnnotationBatchUpsertRequest, document: str = Query(PDF_DEFAULT_DOCUMENT), db: Session = Depends(get_db)
+):
+    """
+    POST /employee/annotations/batch/upsert
+    Batch form of PUT /employee/{id}/annotation: every item is written by
+    one UPDATE in one transaction. Null coordinates clear an annotation.
+    Per-item status is "updated", "cleared" or "not_found"; when an id
+    repeats, its last item wins.
+    """
+    items = {item.employee_id: item for item in data.items}
+    columns = {"ids": [], "x0": [], "x1": [], "y0": [], "y1": [], "page": [], "snippet": []}
+    for employee_id, item in items.items():
+        columns["ids"].append(employee_id)
+        for field in ("x0", "x1", "y0", "y1", "page"):
+            columns[field].append(getattr(item, field))
+        columns["snippet"].append(annotation_snippet(item, document))
+
+    updated = {row.id for row in db.execute(ANNOTATION_UPSERT_SQL, columns)}
+    record_change(db, "annotation", "update", sorted(updated), {
+        employee_id: {**items[employee_id].model_dump(exclude={"employee_id"}), "snippet": columns["snippet"][position]}
+        for position, employee_id in enumerate(items) if employee_id in updated
+    })
+    db.commit()
 
-    all_employees = [dict(row._mapping) for row in rows]
+    results = [{
+        "employee_id": employee_id,
+        "status": "not_found" if employee_id not in updated else ("cleared" if item.x0 is None else "updated"),
+        "snippet": columns["snippet"][position] if employee_id in updated else None
+    } for position, (employee_id, item) in enumerate(items.items())]
 
-    # Create a dictionary to look up manager by ID
-    manager_lookup = {m['id']: m for m in db.execute(text("SELECT * FROM managers")).mappings()}
+    logger.info("Batch upserted annotations for %d of %d employees", len(updated), len(items))
+    return {"updated": len(updated), "not_found": len(items) - len(updated), "results": results}
 
-    def build_path(emp):
-        path = [emp['name']]
-        current_manager_id = emp['manager_id']
 
-        while current_manager_id:
-            manager = manager_lookup.get(current_manager_id)
-            if not manager:
-                break
-            path.insert(0, manager['name'])  
-            current_manager_id = manager.get('manager_id')  
+# POST: Remove annotations of many employees
+@app.post("/employee/annotations/batch/clear")
+@io_bound
+@query_budget(1)
+def clear_employee_annotations_batch(data: AnnotationBatchRequest, db: Session = Depends(get_db)):
+    """
+    POST /employee/annotations/batch/clear
+    Batch form of DELETE /employee/{id}/annotation, in one UPDATE. Status
+    per id is "cleared" or "not_found".
+    """
+    cleared = {row.id for row in db.execute(ANNOTATION_CLEAR_SQL, {"ids": list(set(data.employee_ids))})}
+    record_change(db, "annotation", "delete", sorted(cleared))
+    db.commit()
 
-        return path
+    results = [{"employee_id": employee_id, "status": "cleared" if employee_id in cleared else "not_found"}
+               for employee_id in dict.fromkeys(data.employee_ids)]
+
+    logger.info("Batch cleared annotations for %d employees", len(cleared))
+    return {"cleared": len(cleared), "not_found": len(results) - len(cleared), "results": results}
+
+
+# Uses ix_employees_annotation_box; smallest boxes first so a point hit-test returns the innermost one
+ANNOTATION_REGION_SQL = text(f"""
+    SELECT id, name, manager_id, x0, x1, y0, y1, page, snippet
+    FROM employees
+    WHERE {ANNOTATION_COMPLETE_SQL}
+      AND page = :page
+      AND {ANNOTATION_BOX_SQL} && box(point(:x0, :y0), point(:x1, :y1))
+      AND id IS DISTINCT FROM :exclude
+    ORDER BY abs((x1 - x0) * (y1 - y0)), id
+    LIMIT :limit
+""")
+
+
+# GET: Annotations intersecting a rectangle or point of a page
+@app.get("/api/annotations/region")
+@io_bound
+@query_budget(1)
+def get_annotations_in_region(
+    page: int = Query(..., ge=0),
+    x0: Optional[float] = None,
+    y0: Optional[float] = None,
+    x1: Optional[float] = None,
+    y1: Optional[float] = None,
+    x: Optional[float] = None,
+    y: Optional[float] = None,
+    exclude: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    db: Session = Depends(get_db)
+):
+    """
+    GET /api/annotations/region
+    Returns employee annotations on `page` whose boxes intersect the
+    rectangle x0, y0, x1, y1, or contain the point x, y (hit-testing),
+    smallest box first. `exclude` leaves one employee out, so passing an
+    annotation's own box and id lists what overlaps it.
+    """
+    if x is not None and y is not None:
+        x0, y0, x1, y1 = x, y, x, y
+    elif None in (x0, y0, x1, y1):
+        raise HTTPException(status_code=400, detail="Pass either x0, y0, x1, y1 or x, y")
+
+    rows = db.execute(ANNOTATION_REGION_SQL, {
+        "page": page, "x0": x0, "y0": y0, "x1": x1, "y1": y1, "exclude": exclude, "limit": limit
+    }).mappings().all()
+
+    logger.debug("Region query on page %s matched %d annotations", page, len(rows))
+    return {"page": page, "annotations": [dict(row) for row in rows]}
+
+
+ANNOTATION_PAGE_SQL = text(f"""
+    SELECT id, x0, y0, x1, y1
+    FROM employees
+    WHERE {ANNOTATION_COMPLETE_SQL} AND page = :page
+    ORDER BY id
+""")
+
+
+# GET: Every highlight box of one page, columnar
+@app.get("/api/annotations/page/{page}")
+@query_budget(1)
+def get_page_overlay(
+    page: int,
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(json|binary|msgpack)$"),
+    db: Session = Depends(get_db)
+):
+    """
+    GET /api/annotations/page/{page}
+    Returns the annotation boxes of one page for the viewer's highlight
+    layer as columnar JSON, packed binary or MessagePack (see overlay.py),
+    chosen by `format` or the Accept header, and gzip/brotli-compressed
+    when the client accepts it.
+    """
+    if format is None:
+        accept = request.headers.get("accept", "")
+        format = next((fmt for fmt, media_type in MEDIA_TYPES.items() if media_type in accept), "json")
 
-    for emp in all_employees:
-        emp['path'] = build_path(emp)
+    rows = db.execute(ANNOTATION_PAGE_SQL, {"page": page}).fetchall()
+    try:
+        body = encode_overlay(page, rows, format)
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    body, encoding = compress(body, request.headers.get("accept-encoding"))
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    logger.debug("Overlay for page %s: %d boxes, %d bytes as %s", page, len(rows), len(body), format)
+    return Response(content=body, media_type=MEDIA_TYPES[format], headers=headers)
+
+
+# GET: Words under a rectangle of a PDF page
+@app.get("/api/pdf/{document}/snippet")
+def get_pdf_snippet(
+    document: str,
+    page: int = Query(..., ge=0),
+    x0: float = Query(...),
+    y0: float = Query(...),
+    x1: float = Query(...),
+    y1: float = Query(...)
+):
+    """
+    GET /api/pdf/{document}/snippet
+    Returns the words of `document` (under pdf/) inside the rectangle,
+    using the same coordinates as annotations: PDF points, top-left
+    origin, 0-based page.
+    """
+    try:
+        words = get_page(document, page)
+    except (ValueError, IndexError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Document not found")
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
 
-    
-    print("EMPLOYEE HIERARCHY PATHS:")
-    for emp in all_employees:
-        print(f"{emp['name']}: {emp['path']}")
+    selected = words.words_in(x0, y0, x1, y1)
+    return {"document": document, "page": page, "words": selected, "snippet": " ".join(selected)}
 
-    return all_employees
-from models import Annotation
 
+# GET/HEAD: Serve a PDF with conditional and byte-range support
+@app.api_route("/api/pdf/{document}", methods=["GET", "HEAD"])
+def get_pdf_document(document: str, request: Request):
+    """
+    GET /api/pdf/{document}
+    Streams a document from pdf/. Supports If-None-Match (304), a single
+    Range (206, or 416 when outside the file) guarded by If-Range, so the
+    viewer can fetch pages incrementally. The body is streamed from mmap.
+    """
+    try:
+        path = resolve_document(document)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Document not found")
 
+    return file_response(request, path, "application/pdf", PDF_CACHE_CONTROL)
 
+# ==== API ENDPOINTS ====
 
-COLORS = ["#FFEB3B", "#FFCDD2", "#C8E6C9", "#BBDEFB", "#E1BEE7"]
+# GET org chart for AG Grid Tree View
+from sqlalchemy import text
+from fastapi import Depends, Query
+from sqlalchemy.orm import Session
+from typing import List, Dict, Any
+
+
+@app.get("/org-chart", response_model=List[Dict[str, Any]])
+@query_budget(1)
+def get_org_chart(request: Request, db: Session = Depends(get_db)):
+    # Served from RESPONSE_CACHE until an employee/manager write commits
+    return RESPONSE_CACHE.serve(request, "/org-chart", ("employees", "managers"), lambda: build_org_chart(db))
 
 
-@app.get("/api/search", response_model=List[Dict[str, Any]])
-def search_employees(name: str = Query(...), db: Session = Depends(get_db)):
-    # Get all employees that match the search
-    employee_result = db.execute(text("""
+def build_org_chart(db: Session):
+    # Paths are materialized on employees.path (see hierarchy.py)
+    result = db.execute(text("""
         SELECT emp.*, m.name AS manager_name, m.id AS manager_id
         FROM employees emp
         LEFT JOIN managers m ON emp.manager_id = m.id
-        WHERE emp.name ILIKE :name
-    """), {"name": f"%{name}%"}).fetchall()
-    filtered_employees = [dict(row._mapping) for row in employee_result]
+    """))
 
-    # Get all managers for hierarchy
-    manager_lookup = {
-        m['id']: m for m in db.execute(text("SELECT * FROM managers")).mappings()
-    }
+    all_employees = RowEncoder(result.keys()).dicts(result)
 
-    def build_path(emp):
-        path = [emp['name']]
-        current_manager_id = emp['manager_id']
-        while current_manager_id:
-            manager = manager_lookup.get(current_manager_id)
-            if not manager:
-                break
-            path.insert(0, manager['name'])
-            current_manager_id = manager.get('manager_id')
-        return path
-
-    # Process employees and build their paths
-    for emp in filtered_employees:
-        emp['path'] = build_path(emp)
-        emp['annotation'] = {
-            "pageIndex": emp['page'],
-            "boundingBox": {
-                "left": emp['x0'],
-                "top": emp['y0'],
-                "width": emp['x1'] - emp['x0'],
-                "height": emp['y1'] - emp['y0']
-            },
-            "color": random.choice(COLORS),
-            "type": "pspdfkit/rectangle/highlight",
-            "id": f"highlight-{emp['id']}"
-        }
+    # Per-row tracing is skipped entirely unless DEBUG is enabled for this module
+    if logger.isEnabledFor(logging.DEBUG):
+        for emp in all_employees:
+            logger.debug("Hierarchy path for %s: %s", emp['name'], emp['path'])
+    logger.info("Returning org chart with %d employees", len(all_employees))
 
-    # For row grouping, we only need employees with proper manager_name
-    # Add is_manager flag to employees and ensure they have manager_name
-    for emp in filtered_employees:
-        emp['is_manager'] = False
-        # Ensure manager_name is set correctly (it should already be from the SQL query)
-        if not emp.get('manager_name') and emp.get('manager_id'):
-            manager = manager_lookup.get(emp['manager_id'])
-            if manager:
-                emp['manager_name'] = manager['name']
-        print(f"Employee: {emp['name']} under manager: {emp.get('manager_name', 'No Manager')}")
-    
-    print(f"\nReturning {len(filtered_employees)} employees for row grouping:")
-    for emp in filtered_employees:
-        print(f"  - {emp['name']} (manager: {emp.get('manager_name', 'None')})")
-    
-    # Return only employees - ag-Grid row grouping will create the hierarchy
-    return filtered_employees
+    return all_employees
 
 @app.put("/employee/{employee_id}")
+@io_bound
 def update_employee(employee_id: int, updated: UpdateUser, db: Session = Depends(get_db)):
     emp = db.query(Employee).filter(Employee.id == employee_id).first()
     if not emp:
@@ -465,15 +800,13 @@ def update_employee(employee_id: int, updated: UpdateUser, db: Session = Depends
 
 
     if updated.manager_id:
-        manager = db.query(Employee).filter(Employee.id == updated.manager_id).first()
+        manager = db.query(Manager).filter(Manager.id == updated.manager_id).first()
         if not manager:
             raise HTTPException(status_code=404, detail="Manager not found")
         emp.manager_id = updated.manager_id
-        emp.path = [updated.name, manager.name]
-    else:
-        # Only update name in the path if manager is not changed
-        emp.path[0] = updated.name
 
+    refresh_employee_paths(db, [emp.id])
+    record_change(db, "employee", "update", [emp.id], employee_delta(emp))
     db.commit()
     db.refresh(emp)
     return {"message": "Employee updated successfully", "updated_employee": {
@@ -487,6 +820,8 @@ def update_employee(employee_id: int, updated: UpdateUser, db: Session = Depends
 
 # PUT Update Manager + employee paths
 @app.put("/manager/{manager_id}")
+@io_bound
+@query_budget(5)
 def update_manager(manager_id: int, updated: UpdateUser, db: Session = Depends(get_db)):
     manager = db.query(Manager).filter(Manager.id == manager_id).first()
     if not manager:
@@ -497,102 +832,289 @@ def update_manager(manager_id: int, updated: UpdateUser, db: Session = Depends(g
     manager.email = updated.email
     manager.role = updated.role
 
-    # Update all employee paths
-    employees = db.query(Employee).filter(Employee.manager_id == manager_id).all()
-    for emp in employees:
-        emp.path[0] = updated.name
+    # manager_id here is who this manager reports to; an explicit null
+    # moves the manager to the top level, leaving it out keeps it in place
+    reports_to = manager.manager_id
+    if "manager_id" in updated.model_fields_set:
+        reports_to = updated.manager_id
+    if reports_to != manager.manager_id:
+        if reports_to is not None:
+            if db.get(Manager, reports_to) is None:
+                raise HTTPException(status_code=404, detail="Manager not found")
+            above = [row["id"] for row in chain_of_command(db, manager_id=reports_to)]
+            if manager_id == reports_to or manager_id in above:
+                raise HTTPException(status_code=400, detail="A manager cannot report to themselves or to someone under them")
+        manager.manager_id = reports_to
+        # Everything above the subtree changed: recompute its paths
+        refresh_manager_paths(db, manager_id)
+    elif manager.name != old_name:
+        # Only this manager's own entry in the paths under it changes
+        depth = len(chain_of_command(db, manager_id=manager_id)) + 1
+        rename_in_paths(db, manager_id, depth, manager.name)
+    record_change(db, "manager", "update", [manager_id], {
+        "name": manager.name, "email": manager.email, "role": manager.role, "manager_id": manager.manager_id
+    })
 
     db.commit()
     return {"message": "Manager and employee paths updated"}
 
-@app.post("/api/annotations/save")
-def save_annotations(data: AnnotationSaveRequest, db: Session = Depends(get_db)):
+def write_annotations_in_session(employee_id: int, document: Any, expected):
+    """Run one (possibly coalesced) annotation save in its own session and transaction"""
+    db = SessionLocal()
     try:
-        print(f"💾 Saving annotations for employee {data.employee_id}")
-        
-        # Save or update annotations directly (no employee validation to avoid schema issues)
-        existing = db.query(models.Annotation).filter(models.Annotation.employee_id == data.employee_id).first()
-        if existing:
-            existing.annotations = data.annotations
-            print(f"✅ Updated annotations for employee {data.employee_id}")
-        else:
-            new = models.Annotation(employee_id=data.employee_id, annotations=data.annotations)
-            db.add(new)
-            print(f"✅ Created new annotations for employee {data.employee_id}")
-        
+        result = write_annotations(db, employee_id, document, expected)
+        # Only the revision: subscribers refetch the document with If-None-Match
+        record_change(db, "annotations", "update", [employee_id], {"revision": result[1]})
         db.commit()
-        return {"status": "success", "message": "Annotations saved successfully"}
-        
+        return result
+    finally:
+        db.close()
+
+
+ANNOTATION_SAVES = SaveCoalescer(write_annotations_in_session)
+
+
+def version_conflict(e: VersionConflict) -> HTTPException:
+    """412 carrying the stored revision, so the client can refetch and retry"""
+    headers = {"ETag": format_etag(*e.current)} if e.current else None
+    return HTTPException(status_code=412, detail={
+        "message": str(e),
+        "revision": e.current[1] if e.current else None
+    }, headers=headers)
+
+
+@app.post("/api/annotations/save")
+async def save_annotations(data: AnnotationSaveRequest, request: Request, response: Response):
+    """
+    POST /api/annotations/save
+    Stores an employee's annotations. Pass the ETag you last read as
+    If-Match (or its revision as `version`) to get 412 instead of
+    overwriting someone else's save. Saves arriving within
+    ANNOTATION_COALESCE_MS of each other are written once (see
+    annotation_store.py).
+    """
+    logger.debug("Saving annotations for employee %s", data.employee_id)
+    expected = parse_if_match(request.headers.get("if-match"))
+    if expected is None and data.version is not None:
+        expected = (None, data.version)
+
+    try:
+        (row_id, revision), saves = await ANNOTATION_SAVES.submit(data.employee_id, data.annotations, expected)
+    except VersionConflict as e:
+        logger.info("Rejected stale save for employee %s", data.employee_id)
+        raise version_conflict(e)
     except Exception as e:
-        db.rollback()
-        print(f"❌ Error saving annotations: {str(e)}")
+        logger.exception("Error saving annotations for employee %s", data.employee_id)
         raise HTTPException(status_code=500, detail=f"Failed to save annotations: {str(e)}")
 
+    logger.info("Saved annotations for employee %s (revision %s)", data.employee_id, revision)
+    response.headers["ETag"] = format_etag(row_id, revision)
+    return {"status": "success", "message": "Annotations saved successfully", "revision": revision, "coalesced": saves}
+
+@app.patch("/api/annotations/{employee_id}")
+@query_budget(2)
+def patch_annotations(
+    employee_id: int,
+    request: Request,
+    response: Response,
+    patch: Any = Body(...),
+    db: Session = Depends(get_db)
+):
+    """
+    PATCH /api/annotations/{employee_id}
+    Applies a partial update to an employee's stored annotations: a JSON
+    Patch (RFC 6902) when sent as application/json-patch+json, otherwise a
+    JSON Merge Patch (RFC 7396). Honors If-Match (412 on a stale ETag).
+    Returns the new revision and ETag only, not the document.
+    """
+    annotation = db.query(models.Annotation).filter(
+        models.Annotation.employee_id == employee_id
+    ).with_for_update().first()
+    if not annotation:
+        raise HTTPException(status_code=404, detail="No annotations for this employee")
+
+    expected = parse_if_match(request.headers.get("if-match"))
+    if isinstance(expected, tuple) and expected != (annotation.id, annotation.revision):
+        raise version_conflict(VersionConflict((annotation.id, annotation.revision)))
+
+    try:
+        if request.headers.get("content-type", "").startswith("application/json-patch+json"):
+            annotation.annotations = apply_patch(annotation.annotations, patch)
+        else:
+            annotation.annotations = merge_patch(annotation.annotations, patch)
+    except JsonPatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    annotation.revision += 1
+    revision, etag = annotation.revision, format_etag(annotation.id, annotation.revision)
+    patch_kind = "json_patch" if request.headers.get("content-type", "").startswith("application/json-patch+json") else "merge_patch"
+    record_change(db, "annotations", "patch", [employee_id], {"revision": revision, patch_kind: patch})
+    db.commit()
+
+    logger.info("Patched annotations for employee %s to revision %s", employee_id, revision)
+    response.headers["ETag"] = etag
+    return {"status": "success", "revision": revision}
+
 @app.get("/api/annotations/get/{employee_id}")
-def get_annotations(employee_id: int, db: Session = Depends(get_db)):
-    print(f"🔄 GETTING ANNOTATIONS FOR EMPLOYEE {employee_id}")
+@io_bound
+def get_annotations(employee_id: int, request: Request, db: Session = Depends(get_db)):
+    logger.debug("Getting annotations for employee %s", employee_id)
     
     try:
         # Get the annotation record for this employee
         result = db.query(models.Annotation).filter(models.Annotation.employee_id == employee_id).first()
         
         if not result:
-            print(f"❌ No annotations found for employee {employee_id}")
+            logger.debug("No annotations found for employee %s", employee_id)
             return {"annotations": None}
         
-        print(f"✅ Found annotations for employee {employee_id}")
-        print(f"📊 Data type: {type(result.annotations)}")
+        # Unchanged since the client's copy: skip re-sending the document
+        etag = format_etag(result.id, result.revision)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+        logger.debug("Found annotations for employee %s (revision %s)", employee_id, result.revision)
         
         # Return the raw data exactly as stored
-        return {"annotations": result.annotations}
+        return FastJSONResponse(
+            {"annotations": result.annotations, "revision": result.revision}, headers={"ETag": etag}
+        )
         
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
+        logger.exception("Error getting annotations for employee %s", employee_id)
         return {"annotations": None}
 
 @app.post("/upload/")
-def upload_employees(data: List[EmployeeCreate], db: Session = Depends(get_db)):
-    manager_cache = {}
-    for item in data:
-        manager_name = item.path[0]
-
-        # Check if manager already exists (cached or in DB)
-        if manager_name in manager_cache:
-            manager = manager_cache[manager_name]
-        else:
-            manager = db.query(Manager).filter(Manager.name == manager_name).first()
-            if not manager:
-                manager = Manager(name=manager_name, email=f"{manager_name.lower()}@example.com", role="Manager")
-                db.add(manager)
-                db.commit()
-                db.refresh(manager)
-            manager_cache[manager_name] = manager
-
-        # Create employee
-        employee = Employee(
-            name=item.name,
-            email=item.email,
-            role=item.role,
-            manager_id=manager.id,
-            path=item.path
-        )
-        db.add(employee)
-
+# No @query_budget: every chunk adds its own savepoint, write batches and
+# release, so the statement count grows with the upload size by design
+def upload_employees(
+    data: List[EmployeeCreate],
+    chunk_size: int = Query(UPLOAD_CHUNK_SIZE, ge=1, le=100000),
+    method: str = Query(UPLOAD_METHOD, pattern="^(copy|insert)$"),
+    db: Session = Depends(get_db)
+):
+    """
+    POST /upload/
+    Bulk-imports employees. Managers are resolved in one statement and
+    employees are written in chunks (COPY or multi-row INSERT), each in
+    its own savepoint. Returns per-chunk row counts and errors.
+    """
+    chunks = import_employees(db, data, chunk_size, method)
+    record_change(db, "employee", "import", [], {"inserted": sum(chunk["inserted"] for chunk in chunks)})
     db.commit()
-    return {"message": "Data uploaded successfully"}
 
+    inserted = sum(chunk["inserted"] for chunk in chunks)
+    failed = [chunk for chunk in chunks if chunk["error"]]
+    logger.info("Uploaded %d of %d employees in %d chunks", inserted, len(data), len(chunks))
+    return {
+        "message": "Data uploaded successfully" if not failed else f"{len(failed)} of {len(chunks)} chunks failed",
+        "inserted": inserted,
+        "chunks": chunks
+    }
+
+
+
+# Most per-row validation errors returned by /upload/stream
+STREAM_UPLOAD_MAX_ERRORS = 100
+
+
+def import_batch(items: List[EmployeeCreate], chunk_size: int, method: str, first_chunk: int):
+    """Write one streamed batch in its own session and transaction"""
+    db = SessionLocal()
+    try:
+        chunks = import_employees(db, items, chunk_size, method, first_chunk)
+        record_change(db, "employee", "import", [], {"inserted": sum(chunk["inserted"] for chunk in chunks)})
+        db.commit()
+        return chunks
+    finally:
+        db.close()
+
+
+@app.post("/upload/stream")
+async def upload_employees_stream(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    chunk_size: int = Query(UPLOAD_CHUNK_SIZE, ge=1, le=100000),
+    method: str = Query(UPLOAD_METHOD, pattern="^(copy|insert)$")
+):
+    """
+    POST /upload/stream
+    Imports a CSV (header row required) or NDJSON body of employees
+    without holding the file in memory. Records are parsed and validated
+    as the body arrives and written every `chunk_size` rows, each batch
+    committed on its own. The format comes from `format` or the
+    Content-Type (text/csv, otherwise NDJSON). A record longer than
+    UPLOAD_MAX_RECORD_LENGTH characters is reported as an invalid row.
+    """
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    summary = {"rows": 0, "inserted": 0, "invalid": 0, "errors": [], "chunks": []}
+    batch = []
+
+    async def flush():
+        chunks = await run_in_threadpool(import_batch, batch, chunk_size, method, len(summary["chunks"]) + 1)
+        summary["chunks"].extend(chunks)
+        summary["inserted"] += sum(chunk["inserted"] for chunk in chunks)
+        batch.clear()
+
+    async for row_number, record in iter_records(request.stream(), fmt):
+        summary["rows"] += 1
+        try:
+            if isinstance(record, Exception):
+                raise record
+            batch.append(EmployeeCreate(**record))
+        except (ValueError, TypeError) as e:
+            summary["invalid"] += 1
+            if len(summary["errors"]) < STREAM_UPLOAD_MAX_ERRORS:
+                detail = e.errors(include_url=False) if isinstance(e, ValidationError) else str(e)
+                summary["errors"].append({"row": row_number, "error": detail})
+            continue
+
+        if len(batch) >= chunk_size:
+            await flush()
+
+    if batch:
+        await flush()
+
+    logger.info("Streamed upload: %d rows, %d inserted, %d invalid", summary["rows"], summary["inserted"], summary["invalid"])
+    return summary
+
+
+# POST: AG Grid server-side row model
+@app.post("/api/grid/rows")
+@query_budget(1)
+def get_grid_rows(grid_request: Dict[str, Any] = Body(...), db: Session = Depends(get_db)):
+    """
+    POST /api/grid/rows
+    Datasource for AG Grid's server-side row model. Takes the grid's
+    getRows request (startRow, endRow, rowGroupCols, groupKeys, valueCols,
+    sortModel, filterModel) and returns {rowData, rowCount} for that one
+    block: group rows with child_count while groups are collapsed, leaf
+    employees once every group level is open. See ag_grid.py.
+    """
+    try:
+        query, params, start_row, block_size = build_grid_query(grid_request)
+    except (ValueError, TypeError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid grid request: {e}")
+
+    result = db.execute(query, params)
+    rows = RowEncoder(result.keys()).dicts(result)
+    result = block_response(rows, start_row, block_size)
+    logger.debug("Grid block %s rows from %s", len(result["rowData"]), grid_request.get("startRow"))
+    return FastJSONResponse(result)
 
 
 # GET: Get all managers for dropdown selection
 @app.get("/api/managers")
-def get_managers(db: Session = Depends(get_db)):
+@query_budget(1)
+def get_managers(request: Request, db: Session = Depends(get_db)):
     """
     GET /api/managers
     Returns all managers for dropdown selection in add employee form.
+    Cached (see response_cache.py) until a manager write commits.
     """
-    print(f"📄 Fetching all managers for dropdown")
+    logger.debug("Fetching all managers for dropdown")
     
-    try:
+    def build():
         managers = db.query(models.Manager).all()
         
         managers_list = []
@@ -601,33 +1123,142 @@ def get_managers(db: Session = Depends(get_db)):
                 "id": manager.id,
                 "name": manager.name,
                 "email": manager.email,
-                "role": manager.role
+                "role": manager.role,
+                "manager_id": manager.manager_id
             })
         
-        print(f"✅ Found {len(managers_list)} managers")
+        logger.debug("Found %d managers", len(managers_list))
         return {"managers": managers_list}
+
+    try:
+        return RESPONSE_CACHE.serve(request, "/api/managers", ("managers",), build)
         
     except Exception as e:
-        print(f"❌ Error fetching managers: {str(e)}")
+        logger.exception("Error fetching managers")
         raise HTTPException(status_code=500, detail=f"Failed to fetch managers: {str(e)}")
 
+# GET: Everyone under a manager, to any depth
+@app.get("/api/managers/{manager_id}/subtree")
+@query_budget(2)
+def get_manager_subtree(
+    manager_id: int,
+    depth: Optional[int] = Query(None, ge=1, le=HIERARCHY_MAX_DEPTH),
+    limit: int = Query(10000, ge=1, le=100000),
+    db: Session = Depends(get_db)
+):
+    """
+    GET /api/managers/{manager_id}/subtree?depth=N
+    All managers and employees reporting to this manager, directly or
+    through other managers, down to `depth` levels (direct reports are
+    depth 1; all levels if omitted). One recursive query, see hierarchy.py.
+    Rows are ordered by depth and carry kind "manager" or "employee".
+    """
+    reports = subtree(db, manager_id, depth, limit)
+    if not reports and db.get(Manager, manager_id) is None:
+        raise HTTPException(status_code=404, detail="Manager not found")
+    return {"manager_id": manager_id, "reports": reports, "truncated": len(reports) >= limit}
+
+
+# POST: Move employees to a manager
+@app.post("/api/managers/{manager_id}/reports")
+@io_bound
+@query_budget(2)
+def reassign_employees(manager_id: int, request: ReassignRequest, db: Session = Depends(get_db)):
+    """
+    POST /api/managers/{manager_id}/reports
+    Body: {"employee_ids": [...]}. Makes the employees report to this
+    manager with one UPDATE that also rewrites their paths, however many
+    are moved. Unknown employee ids are returned in `missing`.
+    """
+    if db.get(Manager, manager_id) is None:
+        raise HTTPException(status_code=404, detail="Manager not found")
+
+    moved = move_employees(db, request.employee_ids, manager_id)
+    record_change(db, "employee", "update", moved, {"manager_id": manager_id})
+    db.commit()
+
+    missing = sorted(set(request.employee_ids) - set(moved))
+    logger.info("Moved %d employees to manager %s", len(moved), manager_id)
+    return {"manager_id": manager_id, "moved": len(moved), "missing": missing}
+
+
+# POST: Merge a manager into another
+@app.post("/api/managers/{manager_id}/merge")
+@io_bound
+@query_budget(5)
+def merge_manager(manager_id: int, request: MergeManagersRequest, db: Session = Depends(get_db)):
+    """
+    POST /api/managers/{manager_id}/merge
+    Body: {"into": target_id}. Everyone reporting to this manager, employees
+    and managers, moves to the target and this manager is deleted. Paths
+    under it are rewritten in one UPDATE by swapping the path prefix.
+    """
+    if request.into == manager_id:
+        raise HTTPException(status_code=400, detail="Cannot merge a manager into itself")
+    paths = manager_paths(db, [manager_id, request.into])
+    if len(paths) < 2:
+        raise HTTPException(status_code=404, detail="Manager not found")
+    if manager_id in [row["id"] for row in chain_of_command(db, manager_id=request.into)]:
+        raise HTTPException(status_code=400, detail="Cannot merge a manager into someone under them")
+
+    moved = merge_managers(db, manager_id, request.into, paths[manager_id], paths[request.into])
+    record_change(db, "manager", "delete", [manager_id], {"merged_into": request.into})
+    db.commit()
+
+    logger.info("Merged manager %s into %s (%d employees updated)", manager_id, request.into, moved)
+    return {"message": "Managers merged", "merged_into": request.into, "employees_updated": moved}
+
+
+# GET: Managers above a manager
+@app.get("/api/managers/{manager_id}/chain")
+@io_bound
+@query_budget(2)
+def get_manager_chain(manager_id: int, db: Session = Depends(get_db)):
+    """
+    GET /api/managers/{manager_id}/chain
+    Chain of command above a manager: the manager they report to first,
+    the top of the org last.
+    """
+    chain = chain_of_command(db, manager_id=manager_id)
+    if not chain and db.get(Manager, manager_id) is None:
+        raise HTTPException(status_code=404, detail="Manager not found")
+    return {"manager_id": manager_id, "chain": chain}
+
+
+# GET: Managers above an employee
+@app.get("/api/employees/{employee_id}/chain")
+@io_bound
+@query_budget(2)
+def get_employee_chain(employee_id: int, db: Session = Depends(get_db)):
+    """
+    GET /api/employees/{employee_id}/chain
+    Chain of command for an employee: direct manager first, the top of
+    the org last.
+    """
+    chain = chain_of_command(db, employee_id=employee_id)
+    if not chain and db.get(Employee, employee_id) is None:
+        raise HTTPException(status_code=404, detail="Employee not found")
+    return {"employee_id": employee_id, "chain": chain}
+
+
 # POST: Add new employee
 @app.post("/api/employees")
+@io_bound
 def add_employee(employee_data: UpdateUser, db: Session = Depends(get_db)):
     """
     POST /api/employees
     Creates a new employee with name, email, role, and manager_id.
     Returns created employee data.
     """
-    print(f"➕ Adding new employee with data: {employee_data.dict()}")
+    logger.debug("Adding new employee", extra={"employee": employee_data.dict()})
     
     # Validate manager exists if manager_id is provided
     if employee_data.manager_id:
         manager = db.query(models.Manager).filter(models.Manager.id == employee_data.manager_id).first()
         if not manager:
-            print(f"❌ Manager {employee_data.manager_id} not found")
+            logger.warning("Manager %s not found", employee_data.manager_id)
             raise HTTPException(status_code=404, detail="Manager not found")
-        print(f"✅ Manager found: {manager.name} (ID: {manager.id})")
+        logger.debug("Manager found: %s (ID: %s)", manager.name, manager.id)
     
     try:
         # Create new employee
@@ -640,16 +1271,17 @@ def add_employee(employee_data: UpdateUser, db: Session = Depends(get_db)):
         )
         
         db.add(new_employee)
+        db.flush()
+        refresh_employee_paths(db, [new_employee.id])
+        record_change(db, "employee", "create", [new_employee.id], employee_delta(new_employee))
         db.commit()
         db.refresh(new_employee)
         
-        print(f"✅ Employee created successfully:")
-        print(f"   ID: {new_employee.id}")
-        print(f"   Name: {new_employee.name}")
-        print(f"   Email: {new_employee.email}")
-        print(f"   Role: {new_employee.role}")
-        print(f"   Manager ID: {new_employee.manager_id}")
-        print(f"   Country: {new_employee.country}")
+        logger.info("Employee created", extra={
+            "employee_id": new_employee.id,
+            "manager_id": new_employee.manager_id,
+            "country": new_employee.country
+        })
         
         # Return created employee data
         return {
@@ -664,23 +1296,24 @@ def add_employee(employee_data: UpdateUser, db: Session = Depends(get_db)):
         
     except Exception as e:
         db.rollback()
-        print(f"❌ Error creating employee: {str(e)}")
+        logger.exception("Error creating employee")
         raise HTTPException(status_code=500, detail=f"Failed to create employee: {str(e)}")
 
 # PUT: Update employee details (name, email, role)
 @app.put("/api/employees/{employee_id}")
+@io_bound
 def update_employee(employee_id: int, updated_data: UpdateUser, db: Session = Depends(get_db)):
     """
     PUT /api/employees/{employee_id}
     Updates employee name, email, and role.
     Returns updated employee data.
     """
-    print(f"🔄 Updating employee {employee_id} with data: {updated_data.dict()}")
+    logger.debug("Updating employee %s", employee_id, extra={"employee": updated_data.dict()})
     
     # Find the employee
     employee = db.query(models.Employee).filter(models.Employee.id == employee_id).first()
     if not employee:
-        print(f"❌ Employee {employee_id} not found")
+        logger.warning("Employee %s not found", employee_id)
         raise HTTPException(status_code=404, detail="Employee not found")
     
     # Store old values for logging
@@ -700,14 +1333,22 @@ def update_employee(employee_id: int, updated_data: UpdateUser, db: Session = De
         if updated_data.manager_id is not None:
             employee.manager_id = updated_data.manager_id
         
+        refresh_employee_paths(db, [employee.id])
+        record_change(db, "employee", "update", [employee.id], employee_delta(employee))
         db.commit()
         db.refresh(employee)
         
-        print(f"✅ Employee {employee_id} updated successfully:")
-        print(f"   Name: {old_name} → {employee.name}")
-        print(f"   Email: {old_email} → {employee.email}")
-        print(f"   Role: {old_role} → {employee.role}")
-        print(f"   Country: {old_country} → {employee.country}")
+        logger.info("Employee updated", extra={
+            "employee_id": employee_id,
+            "changes": {
+                field: [old, new] for field, old, new in (
+                    ("name", old_name, employee.name),
+                    ("email", old_email, employee.email),
+                    ("role", old_role, employee.role),
+                    ("country", old_country, employee.country)
+                ) if old != new
+            }
+        })
         
         # Return updated employee data
         return {
@@ -722,38 +1363,36 @@ def update_employee(employee_id: int, updated_data: UpdateUser, db: Session = De
         
     except Exception as e:
         db.rollback()
-        print(f"❌ Error updating employee {employee_id}: {str(e)}")
+        logger.exception("Error updating employee %s", employee_id)
         raise HTTPException(status_code=500, detail=f"Failed to update employee: {str(e)}")
 
 # DELETE: Delete employee from database
 @app.delete("/api/employees/{employee_id}")
+@io_bound
 def delete_employee(employee_id: int, db: Session = Depends(get_db)):
     """
     DELETE /api/employees/{employee_id}
     Deletes an employee from the database.
     Returns confirmation message.
     """
-    print(f"🗑️ Deleting employee {employee_id}")
+    logger.debug("Deleting employee %s", employee_id)
     
     # Find the employee
     employee = db.query(models.Employee).filter(models.Employee.id == employee_id).first()
     if not employee:
-        print(f"❌ Employee {employee_id} not found")
+        logger.warning("Employee %s not found", employee_id)
         raise HTTPException(status_code=404, detail="Employee not found")
     
-    # Store employee info for logging
+    # Store employee info for the response
     employee_name = employee.name
-    employee_email = employee.email
     
     try:
         # Delete the employee
         db.delete(employee)
+        record_change(db, "employee", "delete", [employee_id])
         db.commit()
         
-        print(f"✅ Employee deleted successfully:")
-        print(f"   ID: {employee_id}")
-        print(f"   Name: {employee_name}")
-        print(f"   Email: {employee_email}")
+        logger.info("Employee deleted", extra={"employee_id": employee_id})
         
         return {
             "id": employee_id,
@@ -763,7 +1402,76 @@ def delete_employee(employee_id: int, db: Session = Depends(get_db)):
         
     except Exception as e:
         db.rollback()
-        print(f"❌ Error deleting employee {employee_id}: {str(e)}")
+        logger.exception("Error deleting employee %s", employee_id)
         raise HTTPException(status_code=500, detail=f"Failed to delete employee: {str(e)}")
 
 
+# ==== CHANGE FEED ====
+
+# Seconds between SSE keepalive comments, so proxies don't drop idle streams
+CHANGE_FEED_KEEPALIVE = 15
+
+
+@app.get("/api/changes/stream")
+async def stream_changes(request: Request, last_event_id: Optional[int] = Query(None)):
+    """
+    GET /api/changes/stream
+    Server-Sent Events feed of committed employee, manager and annotation
+    changes (see change_feed.py), one JSON object per event. EventSource
+    resumes from Last-Event-ID after a reconnect; an event with op
+    "resync" means the client must refetch.
+    """
+    header = request.headers.get("last-event-id")
+    if last_event_id is None and header and header.isdigit():
+        last_event_id = int(header)
+    subscriber = broker.subscribe(last_event_id)
+    _, queue = subscriber
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    change = await asyncio.wait_for(queue.get(), CHANGE_FEED_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {change['id']}\ndata: {json.dumps(change, separators=(',', ':'), default=str)}\n\n"
+        finally:
+            broker.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# ==== DIAGNOSTICS ====
+
+# GET: Live connection pool statistics
+@app.get("/api/pool-stats")
+def get_pool_stats():
+    """
+    GET /api/pool-stats
+    Returns checked-out/overflow counts and the checkout wait-time histogram
+    for each database engine, for sizing DB_POOL_SIZE/DB_MAX_OVERFLOW.
+    """
+    stats = {"sync": pool_stats(engine, TimedQueuePool)}
+    if DB_MODE == "async":
+        stats["async"] = pool_stats(async_engine.sync_engine, TimedAsyncQueuePool)
+    return stats
+
+
+# GET: Prometheus metrics
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    GET /metrics
+    Per-route latency, sizes, status counts, query count and DB time,
+    plus connection pool gauges, in the Prometheus text format.
+    """
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+# Keep this last: it swaps the @io_bound routes above for their AsyncSession variants
+if DB_MODE == "async":
+    import async_routes
+    async_routes.install(app)
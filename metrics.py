@@ -0,0 +1,165 @@
+"""
+In-process metric types shared by the database and API instrumentation.
+"""
+
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+
+# Every metric family created without an explicit registry, in render order
+REGISTRY = []
+
+# Upper bounds in seconds, from 1ms to 10s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Prometheus-style histogram with cumulative `le` buckets, safe to share across threads"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+        return {"buckets": buckets, "count": cumulative, "sum": total}
+
+
+class _Family(ABC):
+    """A named metric with one child per combination of label values"""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).append(self)
+
+    @abstractmethod
+    def _new_child(self):
+        ...
+
+    @abstractmethod
+    def samples(self):
+        """(name, labels, value) for every child"""
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _items(self):
+        with self._lock:
+            return list(self._children.items())
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Family):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1, **labels):
+        self.labels(**labels).inc(amount)
+
+    def samples(self):
+        for key, child in self._items():
+            yield self.name, dict(zip(self.labelnames, key)), child.value
+
+
+class HistogramFamily(_Family):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = buckets
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return Histogram(self.buckets)
+
+    def observe(self, value: float, **labels):
+        self.labels(**labels).observe(value)
+
+    def samples(self):
+        for key, child in self._items():
+            yield from histogram_samples(self.name, dict(zip(self.labelnames, key)), child)
+
+
+class GaugeCallback:
+    """Gauge whose samples are read from a callback at scrape time"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback, registry=None):
+        self.name = name
+        self.documentation = documentation
+        # callback() returns [(labels dict, value), ...]
+        self.callback = callback
+        (REGISTRY if registry is None else registry).append(self)
+
+    def samples(self):
+        for labels, value in self.callback():
+            yield self.name, labels, value
+
+
+def histogram_samples(name: str, labels: dict, histogram: Histogram):
+    """Expand a Histogram into Prometheus _bucket/_sum/_count samples"""
+    snapshot = histogram.snapshot()
+    for bound, count in snapshot["buckets"].items():
+        yield f"{name}_bucket", {**labels, "le": bound}, count
+    yield f"{name}_sum", labels, snapshot["sum"]
+    yield f"{name}_count", labels, snapshot["count"]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def render_prometheus(registry=None) -> str:
+    """Render every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in (REGISTRY if registry is None else registry):
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Schema migration script for existing databases.
+Base.metadata.create_all() only creates missing tables, so columns and
+indexes added to models.py afterwards are applied here. Every step is
+idempotent, so the script can be re-run safely after each deploy.
+"""
+
+from sqlalchemy import create_engine, text
+from database import DATABASE_URL
+from hierarchy import PATH_SQL
+from models import ANNOTATION_BOX_SQL, ANNOTATION_COMPLETE_SQL
+import logging
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def require_unique_annotations(conn):
+    """
+    Stop before the unique index if an employee has several annotation rows.
+    Reads never picked one of them deterministically, so which row clients
+    saw is unknown; the duplicates are reported for a person to resolve.
+    """
+    duplicates = conn.execute(text(
+        "SELECT employee_id FROM annotations GROUP BY employee_id HAVING COUNT(*) > 1 ORDER BY employee_id"
+    )).scalars().all()
+    if duplicates:
+        raise RuntimeError(
+            f"annotations has several rows for employee_id {', '.join(map(str, duplicates))}; "
+            "keep one row per employee and re-run the migration"
+        )
+
+
+# (description, statements) in the order they must run; a statement may
+# also be a function taking the connection, for checks
+MIGRATIONS = [
+    ("Trigram indexes for employee/manager name search", [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS ix_employees_name_trgm ON employees USING gin (name gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS ix_managers_name_trgm ON managers USING gin (name gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS ix_employees_manager_id ON employees (manager_id)",
+    ]),
+    ("GiST trigram indexes for ranked name search (distance order with LIMIT)", [
+        "CREATE INDEX IF NOT EXISTS ix_employees_name_trgm_gist ON employees USING gist (name gist_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS ix_managers_name_trgm_gist ON managers USING gist (name gist_trgm_ops)",
+    ]),
+    ("Index for the /api/search keyset order", [
+        "CREATE INDEX IF NOT EXISTS ix_employees_manager_keyset ON employees ((COALESCE(manager_id, 0)), id)",
+    ]),
+    # Before the path backfill: PATH_SQL walks managers.manager_id
+    ("Managers reporting to managers, for recursive hierarchy queries", [
+        "ALTER TABLE managers ADD COLUMN IF NOT EXISTS manager_id INTEGER REFERENCES managers (id)",
+        "CREATE INDEX IF NOT EXISTS ix_managers_manager_id ON managers (manager_id)",
+    ]),
+    ("Materialized hierarchy path on employees", [
+        "ALTER TABLE employees ADD COLUMN IF NOT EXISTS path VARCHAR[]",
+        f"UPDATE employees e SET path = {PATH_SQL} WHERE e.path IS NULL",
+    ]),
+    ("GiST index on annotation boxes per page", [
+        "CREATE EXTENSION IF NOT EXISTS btree_gist",
+        "CREATE INDEX IF NOT EXISTS ix_employees_annotation_box ON employees "
+        f"USING gist (page, ({ANNOTATION_BOX_SQL})) WHERE {ANNOTATION_COMPLETE_SQL}",
+    ]),
+    ("JSONB annotations with revision, GIN index and one row per employee", [
+        "ALTER TABLE annotations ALTER COLUMN annotations TYPE jsonb USING annotations::jsonb",
+        "ALTER TABLE annotations ADD COLUMN IF NOT EXISTS revision INTEGER NOT NULL DEFAULT 1",
+        "CREATE INDEX IF NOT EXISTS ix_annotations_annotations_gin ON annotations USING gin (annotations jsonb_path_ops)",
+        require_unique_annotations,
+        "CREATE UNIQUE INDEX IF NOT EXISTS annotations_employee_id_key ON annotations (employee_id)",
+    ]),
+    ("Sequence numbering change feed events", [
+        "CREATE SEQUENCE IF NOT EXISTS change_feed_seq",
+    ]),
+]
+
+
+def apply_migrations(conn):
+    """Run every migration step on an open connection"""
+    for description, statements in MIGRATIONS:
+        logger.info(f"Applying: {description}")
+        for statement in statements:
+            if callable(statement):
+                statement(conn)
+            else:
+                conn.execute(text(statement))
+
+
+def migrate():
+    """Bring an existing database up to date with models.py"""
+    try:
+        engine = create_engine(DATABASE_URL)
+
+        with engine.begin() as conn:
+            apply_migrations(conn)
+
+        logger.info("Database migration completed successfully!")
+
+    except Exception as e:
+        logger.error(f"Error migrating database: {e}")
+        raise
+
+if __name__ == "__main__":
+    migrate()
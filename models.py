@@ -1,8 +1,20 @@
 # Backup Balaji's code
-from sqlalchemy import Column, Integer, String, ForeignKey, ARRAY, JSON, Float, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, ARRAY, Float, Text, Index, DDL, event, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from database import Base
 
+# Trigram indexes below need pg_trgm and the annotation box index btree_gist;
+# existing databases get them from migrate.py
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+# Numbers change feed events across workers (change_feed.CHANGE_FEED_SEQUENCE)
+event.listen(Base.metadata, "before_create", DDL("CREATE SEQUENCE IF NOT EXISTS change_feed_seq"))
+
+# Annotation rectangle of an employee row, as a Postgres box
+ANNOTATION_BOX_SQL = "box(point(x0, y0), point(x1, y1))"
+ANNOTATION_COMPLETE_SQL = "page IS NOT NULL AND x0 IS NOT NULL AND x1 IS NOT NULL AND y0 IS NOT NULL AND y1 IS NOT NULL"
+
 class Manager(Base):
     __tablename__ = "managers"
 
@@ -10,9 +22,16 @@ class Manager(Base):
     name = Column(String, nullable=False)
     email = Column(String, unique=True, nullable=False)
     role = Column(String, nullable=False)
+    # Manager this manager reports to; NULL at the top of the org (see hierarchy.py)
+    manager_id = Column(Integer, ForeignKey("managers.id"), index=True)
 
     employees = relationship("Employee", back_populates="manager")
 
+    __table_args__ = (
+        Index("ix_managers_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        Index("ix_managers_name_trgm_gist", "name", postgresql_using="gist", postgresql_ops={"name": "gist_trgm_ops"}),
+    )
+
 class Employee(Base):
     __tablename__ = "employees"
 
@@ -20,7 +39,7 @@ class Employee(Base):
     name = Column(String, nullable=False)
     email = Column(String, unique=True, nullable=False)
     role = Column(String, nullable=False)
-    manager_id = Column(Integer, ForeignKey("managers.id"))
+    manager_id = Column(Integer, ForeignKey("managers.id"), index=True)
     country = Column(String, default="India", nullable=False)
     x0 = Column(Float)
     x1 = Column(Float)
@@ -28,11 +47,31 @@ class Employee(Base):
     y1 = Column(Float)
     page = Column(Integer)
     snippet = Column(Text, nullable=True)  # Store extracted text from PDF rectangles
+    path = Column(ARRAY(String))  # Materialized [manager, ..., employee] names, see hierarchy.py
 
     manager = relationship("Manager", back_populates="employees")
+
+    __table_args__ = (
+        Index("ix_employees_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        # Distance order for the ranked name search (search.build_ranked_search_query)
+        Index("ix_employees_name_trgm_gist", "name", postgresql_using="gist", postgresql_ops={"name": "gist_trgm_ops"}),
+        # Keyset order of the /api/search listing (search.SORT_COLUMNS)
+        Index("ix_employees_manager_keyset", text("COALESCE(manager_id, 0)"), "id"),
+        # Region/point lookups on a page: page = :page AND box && :rect
+        Index("ix_employees_annotation_box", "page", text(ANNOTATION_BOX_SQL),
+              postgresql_using="gist", postgresql_where=text(ANNOTATION_COMPLETE_SQL)),
+    )
     
 class Annotation(Base):
     __tablename__ = "annotations"
     id = Column(Integer, primary_key=True)
-    employee_id = Column(Integer, ForeignKey("employees.id"), nullable=False)
-    annotations = Column(JSON, nullable=False) 
+    employee_id = Column(Integer, ForeignKey("employees.id"), nullable=False, unique=True)
+    annotations = Column(JSONB, nullable=False)
+    # Bumped on every write; served as the ETag of /api/annotations/get/{employee_id}
+    revision = Column(Integer, nullable=False, default=1, server_default="1")
+
+    __table_args__ = (
+        Index("ix_annotations_annotations_gin", "annotations", postgresql_using="gin",
+              postgresql_ops={"annotations": "jsonb_path_ops"}),
+    )
+
@@ -0,0 +1,99 @@
+"""
+Encodings for the per-page highlight overlay (/api/annotations/page/{page}).
+Boxes are columnar rather than one dict per annotation, so the payload
+grows with the annotations on the page the viewer shows and nothing else:
+
+  json     {"page", "count", "palette", "ids": [...], "boxes": [x0, y0, x1,
+           y1, ...], "colors": [palette index, ...]}
+  binary   little-endian: b"ANNO", uint8 version (1), 3 padding bytes,
+           uint32 count, then int32 ids[count], float32 boxes[4 * count],
+           uint8 colors[count]; the 12-byte header keeps the arrays
+           4-byte aligned for typed-array views in the browser
+  msgpack  the json document, MessagePack-encoded (needs msgpack)
+
+Colors are derived from the employee id, so a highlight keeps its color
+across reloads and users.
+"""
+
+import gzip
+import struct
+import sys
+from array import array
+from typing import Optional, Sequence, Tuple
+
+from serialization import dumps
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+COLORS = ["#FFEB3B", "#FFCDD2", "#C8E6C9", "#BBDEFB", "#E1BEE7"]
+
+BINARY_MAGIC = b"ANNO"
+BINARY_VERSION = 1
+# Bodies smaller than this aren't worth compressing
+COMPRESS_MIN_BYTES = 1024
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "binary": "application/octet-stream",
+    "msgpack": "application/msgpack",
+}
+
+
+def annotation_color_index(employee_id: int) -> int:
+    return employee_id % len(COLORS)
+
+
+def annotation_color(employee_id: int) -> str:
+    return COLORS[annotation_color_index(employee_id)]
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+
+def encode_overlay(page: int, rows: Sequence[Tuple[int, float, float, float, float]], fmt: str) -> bytes:
+    """Encode (id, x0, y0, x1, y1) rows of one page in the given format"""
+    ids = array("i", (row[0] for row in rows))
+    boxes = array("f", (value for row in rows for value in row[1:5]))
+    colors = bytes(annotation_color_index(employee_id) for employee_id in ids)
+
+    if fmt == "binary":
+        header = struct.pack("<4sB3xI", BINARY_MAGIC, BINARY_VERSION, len(ids))
+        return header + _little_endian(ids) + _little_endian(boxes) + colors
+
+    document = {
+        "page": page,
+        "count": len(ids),
+        "palette": COLORS,
+        "ids": ids.tolist(),
+        # Rounded back from float32 so JSON doesn't carry float noise
+        "boxes": [round(value, 2) for value in boxes],
+        "colors": list(colors),
+    }
+    if fmt == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("msgpack is not installed")
+        return msgpack.packb(document)
+    return dumps(document)
+
+
+def compress(body: bytes, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """Compress with brotli or gzip when the client accepts it; returns (body, Content-Encoding)"""
+    accepted = {part.split(";")[0].strip() for part in (accept_encoding or "").split(",")}
+    if len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    if "br" in accepted and brotli is not None:
+        return brotli.compress(body), "br"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=6), "gzip"
+    return body, None
@@ -0,0 +1,151 @@
+"""
+Content-addressed cache of parsed PDF pages.
+Pages are keyed by the SHA-256 of the file's bytes plus the page number,
+so renamed or copied documents share entries and an edited file never
+serves stale words. Lookups go:
+
+  1. memory: an LRU bounded by PDF_CACHE_MAX_BYTES (approximate size of
+     words, boxes and grid index), evicting least recently used pages;
+  2. disk: PDF_CACHE_DIR/<digest>/<page>.boxes holds the word boxes as
+     raw native-endian float32 x0, y0, x1, y1 quadruples and is
+     memory-mapped rather than read; <page>.words holds the words,
+     NUL-separated, as UTF-8;
+  3. PyMuPDF extraction, whose result is written to disk for next time.
+
+File digests are remembered per (path, size, mtime), so a warm lookup
+neither rehashes nor reparses the document.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".pdf_cache"))
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Rough per-word heap cost on top of its characters: str header, list slot, grid cell entries
+WORD_OVERHEAD_BYTES = 120
+
+CACHE_LOOKUPS = Counter("pdf_page_cache_lookups_total", "PDF page lookups by where they were served from", ("source",))
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PageCache:
+    """
+    LRU of parsed pages in front of an mmap'd on-disk store.
+    `extract(path, page)` returns (words, float32 boxes) for a cache miss
+    and `build(words, boxes)` turns them into the cached page object.
+    """
+
+    def __init__(self, extract: Callable[[str, int], Tuple[List[str], array]], build: Callable,
+                 directory: str = PDF_CACHE_DIR, max_bytes: int = PDF_CACHE_MAX_BYTES):
+        self.extract = extract
+        self.build = build
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[object, int]]" = OrderedDict()
+        self._digests: Dict[str, Tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+
+    def digest(self, path: str) -> str:
+        """SHA-256 of the file, recomputed only when its size or mtime changes"""
+        stat = os.stat(path)
+        known = self._digests.get(path)
+        if known is not None and known[:2] == (stat.st_size, stat.st_mtime_ns):
+            return known[2]
+        digest = _hash_file(path)
+        self._digests[path] = (stat.st_size, stat.st_mtime_ns, digest)
+        return digest
+
+    def get(self, path: str, page: int):
+        key = (self.digest(path), page)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                CACHE_LOOKUPS.inc(source="memory")
+                return entry[0]
+
+        loaded = self._read(*key)
+        if loaded is not None:
+            CACHE_LOOKUPS.inc(source="disk")
+        else:
+            CACHE_LOOKUPS.inc(source="extract")
+            loaded = self.extract(path, page)
+            self._write(*key, *loaded)
+        words, boxes = loaded
+
+        value = self.build(words, boxes)
+        self._remember(key, value, 4 * len(boxes) + sum(len(word) + WORD_OVERHEAD_BYTES for word in words))
+        return value
+
+    def _remember(self, key, value, size: int):
+        with self._lock:
+            if key in self._entries:
+                self.size_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.size_bytes += size
+            # Keep at least the page just loaded, even if it alone exceeds the bound
+            while self.size_bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size_bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _paths(self, digest: str, page: int) -> Tuple[str, str]:
+        base = os.path.join(self.directory, digest, str(page))
+        return base + ".words", base + ".boxes"
+
+    def _read(self, digest: str, page: int) -> Optional[Tuple[List[str], object]]:
+        words_path, boxes_path = self._paths(digest, page)
+        try:
+            with open(words_path, "rb") as f:
+                data = f.read()
+            with open(boxes_path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return [], array("f")
+                # The mapping stays valid after the file is closed
+                boxes = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)).cast("f")
+        except FileNotFoundError:
+            return None
+        words = data.decode("utf-8").split("\0") if data else []
+        if len(boxes) != 4 * len(words):
+            logger.warning("Discarding corrupt PDF cache entry %s page %s", digest, page)
+            return None
+        return words, boxes
+
+    def _write(self, digest: str, page: int, words: List[str], boxes: array):
+        words_path, boxes_path = self._paths(digest, page)
+        try:
+            os.makedirs(os.path.dirname(words_path), exist_ok=True)
+            # Boxes first and each file swapped in atomically, so readers never see a half-written page
+            for path, payload in ((boxes_path, boxes.tobytes()), (words_path, "\0".join(words).encode("utf-8"))):
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(payload)
+                os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not write PDF cache entry %s page %s: %s", digest, page, e)
@@ -0,0 +1,113 @@
+"""
+Server-side PDF text layer for annotation snippets.
+Word boxes are extracted with PyMuPDF once per document page, cached by
+pdf_cache.PageCache (in memory and on disk) and kept with a GridIndex,
+so the words under an annotation rectangle are found by box intersection
+rather than estimated in the browser from average character widths.
+Coordinates match what the viewer stores on Employee: PDF points with a
+top-left origin and 0-based page numbers.
+
+Documents are looked up by file name under PDF_DIR (default ./pdf).
+PyMuPDF is optional; without it snippet_for() returns None and callers
+keep whatever snippet the client sent.
+"""
+
+import logging
+import os
+from array import array
+from typing import List, Optional, Tuple
+
+from metrics import GaugeCallback
+from pdf_cache import PageCache
+from spatial import GridIndex
+
+try:
+    import pymupdf
+except ImportError:  # pragma: no cover - optional dependency
+    pymupdf = None
+
+logger = logging.getLogger(__name__)
+
+PDF_DIR = os.path.abspath(os.getenv("PDF_DIR", os.path.join(os.path.dirname(__file__), "pdf")))
+# Document annotations on Employee refer to; the viewer only shows this one today
+PDF_DEFAULT_DOCUMENT = os.getenv("PDF_DEFAULT_DOCUMENT", "wellcome.pdf")
+
+
+class PageWords:
+    """Words of one PDF page with their boxes and a grid index over them"""
+
+    def __init__(self, words: List[str], boxes):
+        self.words = words
+        self.boxes = boxes
+        self.index = GridIndex(boxes)
+
+    def words_in(self, x0: float, y0: float, x1: float, y1: float) -> List[str]:
+        """
+        Words covered by the rectangle, in reading order. A word counts when
+        it overlaps the rectangle vertically and either its horizontal centre
+        is inside or more than half of its width is.
+        """
+        x0, x1 = min(x0, x1), max(x0, x1)
+        selected = []
+        for number in self.index.query(x0, y0, x1, y1):
+            left, _, right, _ = self.index.box(number)
+            width = right - left
+            centre = (left + right) / 2
+            overlap = max(0.0, min(right, x1) - max(left, x0))
+            if x0 <= centre <= x1 or (width > 0 and overlap / width > 0.5):
+                selected.append(self.words[number])
+        return selected
+
+    def snippet(self, x0: float, y0: float, x1: float, y1: float) -> str:
+        return " ".join(self.words_in(x0, y0, x1, y1))
+
+
+def resolve_document(name: str) -> str:
+    """Absolute path of a document under PDF_DIR; rejects anything outside it"""
+    root = os.path.realpath(PDF_DIR)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([path, root]) != root or not path.endswith(".pdf"):
+        raise ValueError(f"Invalid document name: {name}")
+    if not os.path.isfile(path):
+        raise FileNotFoundError(name)
+    return path
+
+
+def extract_page(path: str, page: int) -> Tuple[List[str], array]:
+    """Read the words and float32 boxes of one page (0-based) with PyMuPDF"""
+    if pymupdf is None:
+        raise RuntimeError("PyMuPDF is not installed")
+    with pymupdf.open(path) as document:
+        if not 0 <= page < document.page_count:
+            raise IndexError(f"{os.path.basename(path)} has no page {page}")
+        # (x0, y0, x1, y1, word, block, line, word_no), already in reading order
+        entries = document[page].get_text("words")
+
+    boxes = array("f")
+    for entry in entries:
+        boxes.extend(entry[:4])
+    return [entry[4] for entry in entries], boxes
+
+
+PAGE_CACHE = PageCache(extract_page, PageWords)
+
+GaugeCallback("pdf_page_cache_bytes", "Approximate memory held by cached PDF pages",
+              lambda: [({}, PAGE_CACHE.size_bytes)])
+GaugeCallback("pdf_page_cache_pages", "PDF pages held in memory", lambda: [({}, len(PAGE_CACHE))])
+
+
+def get_page(document: str, page: int) -> PageWords:
+    return PAGE_CACHE.get(resolve_document(document), page)
+
+
+def snippet_for(document: str, page: int, x0: float, y0: float, x1: float, y1: float) -> Optional[str]:
+    """
+    Text under an annotation rectangle, or None when it can't be computed
+    (no PyMuPDF, unknown document or page)
+    """
+    try:
+        words = get_page(document, page)
+    except (RuntimeError, ValueError, OSError, IndexError) as e:
+        logger.warning("No text layer for %s page %s: %s", document, page, e)
+        return None
+    return words.snippet(x0, y0, x1, y1) or None
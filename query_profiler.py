@@ -0,0 +1,138 @@
+"""
+Query profiling mode for development, tests and staging.
+Enabled with QUERY_PROFILE=1: database.py and wellcome/database.py pass
+their engines to instrument(), and QueryProfilerMiddleware collects every
+statement a request runs. At the end of each request it logs statements
+repeated QUERY_PROFILE_REPEAT_THRESHOLD or more times (the N+1 pattern),
+statements slower than QUERY_PROFILE_SLOW_MS, and handlers that ran more
+statements than they declared with @query_budget(n). Statements run with
+the execution option query_profile=False (the change feed's NOTIFY) are
+not recorded.
+
+With QUERY_PROFILE_STRICT=1 a budget overrun raises QueryBudgetExceeded
+instead, which TestClient re-raises, so running pytest with
+
+    QUERY_PROFILE=1 QUERY_PROFILE_STRICT=1 pytest
+
+fails any test that drives an endpoint past its budget.
+"""
+
+import logging
+import os
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("QUERY_PROFILE", "").lower() in ("1", "true", "yes")
+STRICT = os.getenv("QUERY_PROFILE_STRICT", "").lower() in ("1", "true", "yes")
+SLOW_SECONDS = float(os.getenv("QUERY_PROFILE_SLOW_MS", "100")) / 1000
+REPEAT_THRESHOLD = int(os.getenv("QUERY_PROFILE_REPEAT_THRESHOLD", "5"))
+
+
+class QueryBudgetExceeded(AssertionError):
+    """An endpoint ran more SQL statements than its declared budget"""
+
+
+class QueryProfile:
+    """Statements run on behalf of one request"""
+
+    def __init__(self):
+        self.statements = []
+
+    def record(self, statement: str, seconds: float):
+        self.statements.append((" ".join(statement.split()), seconds))
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def repeated(self, threshold: int = REPEAT_THRESHOLD):
+        """Identical statements run at least `threshold` times, most frequent first"""
+        counts = Counter(statement for statement, _ in self.statements)
+        return [(statement, n) for statement, n in counts.most_common() if n >= threshold]
+
+    def slow(self, threshold: float = SLOW_SECONDS):
+        return [(statement, seconds) for statement, seconds in self.statements if seconds >= threshold]
+
+
+profile_var: ContextVar[Optional[QueryProfile]] = ContextVar("query_profile", default=None)
+
+
+def query_budget(max_queries: int):
+    """Declare the most statements a handler may run; checked in profiling mode"""
+    def decorator(endpoint):
+        endpoint.__query_budget__ = max_queries
+        return endpoint
+    return decorator
+
+
+def _shorten(statement: str, length: int = 200) -> str:
+    return statement if len(statement) <= length else statement[:length] + "..."
+
+
+def instrument(engine):
+    """Record statements run on `engine` into the current request's profile"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["profile_started"].pop()
+        if context is not None and context.execution_options.get("query_profile") is False:
+            return
+        profile = profile_var.get()
+        if profile is not None:
+            profile.record(statement, elapsed)
+        elif elapsed >= SLOW_SECONDS:
+            # Outside a profiled request (scripts, background work) only slow statements are reported
+            logger.warning("Slow statement (%.1f ms): %s", elapsed * 1000, _shorten(" ".join(statement.split())))
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get("profile_started"):
+            context.connection.info["profile_started"].pop()
+
+
+def report(profile: QueryProfile, label: str, budget: Optional[int] = None):
+    """Log what the profile found and enforce the budget in strict mode"""
+    for statement, n in profile.repeated():
+        logger.warning("Possible N+1 in %s: statement ran %d times: %s", label, n, _shorten(statement))
+    for statement, seconds in profile.slow():
+        logger.warning("Slow statement in %s (%.1f ms): %s", label, seconds * 1000, _shorten(statement))
+
+    if budget is not None and profile.count > budget:
+        message = f"{label} ran {profile.count} statements, budget is {budget}"
+        if STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+    else:
+        logger.debug("%s ran %d statements", label, profile.count)
+
+
+class QueryProfilerMiddleware:
+    """ASGI middleware giving each request its own QueryProfile"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        profile = QueryProfile()
+        token = profile_var.set(profile)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profile_var.reset(token)
+
+        route = scope.get("route")
+        label = f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+        report(profile, label, getattr(getattr(route, "endpoint", None), "__query_budget__", None))
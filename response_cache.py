@@ -0,0 +1,170 @@
+"""
+Read-through cache of serialized JSON responses (/org-chart, /api/managers).
+Handlers hand ResponseCache.serve() a key, the tables the response reads
+and a function building the data; a hit returns the stored bytes and
+ETag without touching the database or the JSON encoder, and a matching
+If-None-Match returns 304.
+
+Entries are invalidated by table through the change feed: every write
+handler records its change (change_feed.record_change), and once it
+commits invalidate_change() drops the entries reading that table. With
+CHANGE_FEED_BACKEND=postgres this also covers writes made by other
+workers. A per-table generation counter stops a build that overlapped a
+write from storing its stale result; the counter check and the store
+happen under the same lock as the bump and the drop in invalidate().
+
+Storage is pluggable: MemoryBackend (TTL + LRU, bounded by entries and
+bytes) is the default; anything implementing CacheBackend can be passed
+instead, e.g. a shared store for several workers.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, NamedTuple, Optional
+
+from fastapi import Request, Response
+
+from file_serving import etag_matches
+from metrics import Counter, GaugeCallback
+from serialization import dumps
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+CACHE_REQUESTS = Counter("response_cache_requests_total", "Cached endpoint requests by outcome", ("route", "result"))
+
+# Tables each change-feed entity writes to; employee imports also create managers
+ENTITY_TABLES = {
+    "employee": ("employees",),
+    "annotation": ("employees",),          # rectangles live on employees
+    "manager": ("managers", "employees"),  # manager renames rewrite employee paths
+}
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    tables: tuple
+    expires: float
+
+
+class CacheBackend(ABC):
+    """Storage for cached responses"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[CachedResponse]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, entry: CachedResponse):
+        ...
+
+    @abstractmethod
+    def invalidate(self, table: str):
+        """Drop every entry built from `table`"""
+
+
+class MemoryBackend(CacheBackend):
+    """In-process TTL + LRU store"""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CachedResponse):
+        if len(entry.body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.size_bytes += len(entry.body)
+            while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, table: str):
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if table in entry.tables]:
+                self._remove(key)
+
+    def _remove(self, key: str):
+        self.size_bytes -= len(self._entries.pop(key).body)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ResponseCache:
+    def __init__(self, backend: CacheBackend = None, ttl: float = RESPONSE_CACHE_TTL):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, tables: Iterable[str]):
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+                self.backend.invalidate(table)
+
+    def invalidate_change(self, change: dict):
+        """change_feed listener: drop entries reading the tables a committed change touched"""
+        if change.get("op") == "resync":
+            self.invalidate(list(self._generations) or ("employees", "managers"))
+        elif change.get("op") == "import":
+            self.invalidate(("employees", "managers"))
+        else:
+            self.invalidate(ENTITY_TABLES.get(change.get("entity"), ()))
+
+    def serve(self, request: Request, route: str, tables: tuple, build: Callable[[], object]) -> Response:
+        """
+        Cached JSON response for this route and query string, building it on
+        a miss. `build` returns the data, or its already encoded JSON bytes.
+        """
+        key = f"{route}?{request.url.query}"
+        entry = self.backend.get(key)
+        result = "hit"
+
+        if entry is None:
+            result = "miss"
+            generations = [self._generations.get(table, 0) for table in tables]
+            body = build()
+            if not isinstance(body, bytes):
+                body = dumps(body)
+            entry = CachedResponse(body, f'"{hashlib.sha1(body).hexdigest()}"', tables, time.monotonic() + self.ttl)
+            # Skip storing if a write to one of the tables committed while we were building
+            with self._lock:
+                if generations == [self._generations.get(table, 0) for table in tables]:
+                    self.backend.set(key, entry)
+
+        headers = {"ETag": entry.etag, "X-Cache": result.upper()}
+        if etag_matches(request.headers.get("if-none-match"), entry.etag):
+            CACHE_REQUESTS.inc(route=route, result="not_modified")
+            return Response(status_code=304, headers=headers)
+        CACHE_REQUESTS.inc(route=route, result=result)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+RESPONSE_CACHE = ResponseCache()
+
+GaugeCallback("response_cache_entries", "Responses held by the in-process response cache",
+              lambda: [({}, len(RESPONSE_CACHE.backend))] if isinstance(RESPONSE_CACHE.backend, MemoryBackend) else [])
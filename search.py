@@ -0,0 +1,146 @@
+"""
+Employee search queries shared by the /api/search handlers.
+Keeps the SQL, the keyset cursor format and the row shape in one place
+so the JSON and NDJSON responses stay identical.
+"""
+
+import base64
+import json
+import os
+from typing import Optional, Tuple
+
+from sqlalchemy import text
+
+# Rows fetched per round trip when streaming from a server-side cursor
+STREAM_BATCH_SIZE = 1000
+
+# Most rows a ranked name search returns
+SEARCH_RESULT_CAP = int(os.getenv("SEARCH_RESULT_CAP", "200"))
+
+SEARCH_SELECT = """
+    SELECT
+        e.id,
+        e.name,
+        e.email,
+        e.role,
+        e.manager_id,
+        e.country,
+        e.x0,
+        e.x1,
+        e.y0,
+        e.y1,
+        e.page,
+        e.snippet,
+        m.name as manager_name,
+        e.path
+    FROM employees e
+    LEFT JOIN managers m ON e.manager_id = m.id
+"""
+
+# Keyset ordering on employee columns only, so ix_employees_manager_keyset
+# serves it: each page is an index range scan that stops after LIMIT rows,
+# with managers joined per row. Employees without a manager sort first.
+SORT_COLUMNS = "COALESCE(e.manager_id, 0), e.id"
+
+
+def encode_cursor(manager_id: Optional[int], employee_id: int) -> str:
+    """Encode the (manager_id, id) keyset position as an opaque token"""
+    raw = json.dumps([manager_id or 0, employee_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """Decode a token from encode_cursor; raises ValueError if it is malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        manager_id, employee_id = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if type(manager_id) is not int or type(employee_id) is not int:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return manager_id, employee_id
+
+
+def build_search_query(cursor: Optional[str] = None, limit: Optional[int] = None):
+    """
+    Build the statement that lists every employee and its bind parameters.
+    Results are ordered by (manager_id, id), so employees of a manager stay
+    together and a page can resume after the last row of the previous one
+    without OFFSET.
+    """
+    params = {}
+    query = SEARCH_SELECT
+
+    if cursor:
+        params["cursor_manager"], params["cursor_id"] = decode_cursor(cursor)
+        query += f" WHERE ({SORT_COLUMNS}) > (:cursor_manager, :cursor_id)"
+    query += f" ORDER BY {SORT_COLUMNS}"
+
+    if limit is not None:
+        # One extra row tells us whether another page exists
+        query += " LIMIT :limit"
+        params["limit"] = limit + 1
+
+    return text(query), params
+
+
+def escape_like(value: str) -> str:
+    """Escape LIKE wildcards so `value` matches literally (backslash is the default escape)"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def build_ranked_search_query(name: str, limit: int = SEARCH_RESULT_CAP):
+    """
+    Build a name search ranked by trigram word distance and capped at `limit`.
+    Each branch reads its table in `:name <<-> name` order, which the
+    gist_trgm_ops indexes created by migrate.py return directly, and stops
+    after `limit` matches, so a common term (including the one or two
+    characters of the first keystrokes) costs about `limit` index entries
+    whatever the table size. Rare terms of three or more characters can
+    still be answered from the gin_trgm_ops indexes; the planner picks.
+    """
+    query = f"""
+    WITH named AS (
+        SELECT e.id, :name <<-> e.name AS distance
+        FROM employees e
+        WHERE e.name ILIKE :pattern
+        ORDER BY :name <<-> e.name
+        LIMIT :limit
+    ),
+    closest_managers AS (
+        SELECT m.id, :name <<-> m.name AS distance
+        FROM managers m
+        WHERE m.name ILIKE :pattern
+        ORDER BY :name <<-> m.name
+        LIMIT :limit
+    ),
+    managed AS (
+        SELECT team.id, m.distance
+        FROM closest_managers m
+        CROSS JOIN LATERAL (
+            SELECT e.id FROM employees e WHERE e.manager_id = m.id ORDER BY e.id LIMIT :limit
+        ) team
+    ),
+    ranked AS (
+        SELECT id, MIN(distance) AS distance
+        FROM (SELECT * FROM named UNION ALL SELECT * FROM managed) matches
+        GROUP BY id
+        ORDER BY distance, id
+        LIMIT :limit
+    )
+    {SEARCH_SELECT}
+    JOIN ranked ON ranked.id = e.id
+    ORDER BY ranked.distance, e.id
+    """
+    return text(query), {
+        "name": name, "pattern": f"%{escape_like(name)}%", "limit": min(limit, SEARCH_RESULT_CAP)
+    }
+
+
+def next_cursor(rows: list, limit: Optional[int]) -> Optional[str]:
+    """Return the cursor for the following page, trimming the look-ahead row"""
+    if limit is None or len(rows) <= limit:
+        return None
+    del rows[limit:]
+    last = rows[-1]
+    return encode_cursor(last["manager_id"], last["id"])
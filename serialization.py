@@ -0,0 +1,66 @@
+"""
+JSON encoding for API responses.
+dumps() uses orjson when it is installed (it writes bytes directly and is
+several times faster than the stdlib encoder) and falls back to json
+otherwise. FastJSONResponse renders with it and is the app's default
+response class; handlers that return one themselves also skip FastAPI's
+jsonable_encoder pass, which costs more than the encoding itself on large
+lists. RowEncoder shapes result rows with a fixed column list for the big
+list endpoints (see bench_serialization.py).
+"""
+
+import json
+from decimal import Decimal
+from typing import Any, Iterable, List, Sequence
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value: Any):
+    # Numeric aggregates come back as Decimal; jsonable_encoder made them floats too
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def dumps(content: Any) -> bytes:
+    """Compact UTF-8 JSON for `content`"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps()"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class RowEncoder:
+    """
+    Rows of a statement with known columns, as JSON objects.
+    dict(zip()) per row is built in C and is cheaper than encoding values
+    one at a time into a bytes template, so rows still become dicts, but
+    without attribute lookups or a second walk by jsonable_encoder.
+    """
+
+    def __init__(self, columns: Sequence[str]):
+        self.columns = tuple(columns)
+
+    def dicts(self, rows: Iterable[Sequence]) -> List[dict]:
+        columns = self.columns
+        return [dict(zip(columns, row)) for row in rows]
+
+    def encode(self, rows: Iterable[Sequence]) -> bytes:
+        """JSON array of objects, one per row"""
+        return dumps(self.dicts(rows))
+
+    def encode_lines(self, rows: Iterable[Sequence]) -> bytes:
+        """NDJSON, one object per line"""
+        return b"".join(dumps(row) + b"\n" for row in self.dicts(rows))
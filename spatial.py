@@ -0,0 +1,65 @@
+"""
+Uniform grid index over axis-aligned boxes.
+Boxes are stored flat as x0, y0, x1, y1 quadruples (any indexable float
+sequence, e.g. array("f")), and each grid cell lists the boxes touching
+it, so a rectangle query only visits the cells it covers instead of
+every box on the page. Results are box numbers in insertion order, which
+for PDF words is reading order.
+"""
+
+import os
+from math import floor
+from typing import Dict, List, Sequence, Tuple
+
+# Cell edge in PDF points; a few words wide and a couple of lines tall
+GRID_CELL_SIZE = float(os.getenv("GRID_CELL_SIZE", "48"))
+
+
+class GridIndex:
+    """Box numbers bucketed by the grid cells they overlap"""
+
+    def __init__(self, boxes: Sequence[float], cell_size: float = GRID_CELL_SIZE):
+        self.boxes = boxes
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        self.max_col = self.max_row = -1
+
+        for number in range(len(boxes) // 4):
+            x0, y0, x1, y1 = self.box(number)
+            col0, row0, col1, row1 = self._cell_range(x0, y0, x1, y1)
+            self.max_col = max(self.max_col, col1)
+            self.max_row = max(self.max_row, row1)
+            for col in range(col0, col1 + 1):
+                for row in range(row0, row1 + 1):
+                    self.cells.setdefault((col, row), []).append(number)
+
+    def __len__(self) -> int:
+        return len(self.boxes) // 4
+
+    def box(self, number: int) -> Tuple[float, float, float, float]:
+        offset = number * 4
+        return tuple(self.boxes[offset:offset + 4])
+
+    def _cell_range(self, x0, y0, x1, y1):
+        size = self.cell_size
+        return (max(0, floor(x0 / size)), max(0, floor(y0 / size)),
+                max(0, floor(x1 / size)), max(0, floor(y1 / size)))
+
+    def query(self, x0: float, y0: float, x1: float, y1: float) -> List[int]:
+        """Numbers of the boxes intersecting the rectangle, in insertion order"""
+        x0, x1 = min(x0, x1), max(x0, x1)
+        y0, y1 = min(y0, y1), max(y0, y1)
+        col0, row0, col1, row1 = self._cell_range(x0, y0, x1, y1)
+
+        candidates = set()
+        # Clamp to the populated grid so a huge rectangle doesn't walk empty cells
+        for col in range(col0, min(col1, self.max_col) + 1):
+            for row in range(row0, min(row1, self.max_row) + 1):
+                candidates.update(self.cells.get((col, row), ()))
+
+        boxes = self.boxes
+        return sorted(
+            number for number in candidates
+            if boxes[number * 4] <= x1 and boxes[number * 4 + 2] >= x0
+            and boxes[number * 4 + 1] <= y1 and boxes[number * 4 + 3] >= y0
+        )
@@ -0,0 +1,85 @@
+"""
+SQL generated for AG Grid server-side row model requests
+"""
+
+import pytest
+
+from ag_grid import block_response, build_grid_query
+
+
+def query(request: dict):
+    statement, params, start_row, block_size = build_grid_query(request)
+    return " ".join(statement.text.split()), params, start_row, block_size
+
+
+def test_leaf_rows_fetch_one_extra_row():
+    sql, params, start_row, block_size = query({"startRow": 100, "endRow": 200})
+    assert sql.endswith("ORDER BY e.id LIMIT :p0 OFFSET :p1")
+    assert params == {"p0": 101, "p1": 100}
+    assert (start_row, block_size) == (100, 100)
+
+
+def test_block_size_is_capped():
+    _, params, _, block_size = query({"startRow": 0, "endRow": 1_000_000})
+    assert block_size == 5000 and params["p0"] == 5001
+
+
+def test_group_level_with_aggregate_and_sort():
+    sql, params, _, _ = query({
+        "rowGroupCols": [{"field": "country"}, {"field": "role"}],
+        "groupKeys": ["India"],
+        "valueCols": [{"field": "page", "aggFunc": "max"}],
+        "sortModel": [{"colId": "child_count", "sort": "desc"}, {"colId": "name", "sort": "asc"}],
+    })
+    assert "SELECT e.role AS role, COUNT(*) AS child_count, MAX(e.page) AS page" in sql
+    assert "WHERE e.country IS NOT DISTINCT FROM :p0 GROUP BY e.role" in sql
+    # name isn't a column at this group level, so its sort is dropped
+    assert "ORDER BY COUNT(*) DESC NULLS LAST, e.role LIMIT" in sql
+    assert params["p0"] == "India"
+
+
+def test_text_filters_escape_like_patterns():
+    sql, params, _, _ = query({"filterModel": {"name": {"filterType": "text", "type": "contains", "filter": "50%_a"}}})
+    assert "WHERE e.name ILIKE :p0" in sql
+    assert params["p0"] == "%50\\%\\_a%"
+
+
+@pytest.mark.parametrize("field, column", [("id", "e.id"), ("page", "e.page"), ("path", "e.path")])
+def test_text_filters_on_non_text_columns_compare_text(field, column):
+    sql, params, _, _ = query({"filterModel": {field: {"filterType": "text", "type": "contains", "filter": "1"}}})
+    assert f"WHERE CAST({column} AS text) ILIKE :p0" in sql
+    assert params["p0"] == "%1%"
+
+
+def test_combined_number_filter():
+    sql, params, _, _ = query({"filterModel": {"page": {
+        "filterType": "number", "operator": "OR",
+        "conditions": [{"type": "lessThan", "filter": 2}, {"type": "inRange", "filter": "5", "filterTo": 7.5}],
+    }}})
+    assert "WHERE (e.page < :p0 OR e.page BETWEEN :p1 AND :p2)" in sql
+    assert (params["p0"], params["p1"], params["p2"]) == (2, 5.0, 7.5)
+
+
+def test_set_filter_matches_blanks():
+    sql, params, _, _ = query({"filterModel": {"country": {"filterType": "set", "values": ["India", None]}}})
+    assert "WHERE (CAST(e.country AS text) = ANY(:p0) OR e.country IS NULL)" in sql
+    assert params["p0"] == ["India"]
+
+
+@pytest.mark.parametrize("request_", [
+    {"sortModel": [], "filterModel": {"password": {"type": "equals", "filter": "x"}}},
+    {"rowGroupCols": [{"field": "e.id; DROP TABLE employees"}]},
+    {"rowGroupCols": [{"field": "country"}], "valueCols": [{"field": "name", "aggFunc": "sum"}]},
+    {"filterModel": {"name": {"filterType": "text", "type": "regex", "filter": "x"}}},
+    {"filterModel": {"page": {"filterType": "number", "type": "equals", "filter": "abc"}}},
+    {"filterModel": {"page": {"filterType": "number", "type": "equals", "filter": None}}},
+    {"filterModel": {"page": {"filterType": "number", "type": "inRange", "filter": 1, "filterTo": "nan"}}},
+])
+def test_invalid_requests_raise_value_error(request_):
+    with pytest.raises(ValueError):
+        build_grid_query(request_)
+
+
+def test_block_response_row_count():
+    assert block_response([{}] * 11, 20, 10) == {"rowData": [{}] * 10, "rowCount": -1}
+    assert block_response([{}] * 3, 20, 10) == {"rowData": [{}] * 3, "rowCount": 23}
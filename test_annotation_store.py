@@ -0,0 +1,111 @@
+"""
+SaveCoalescer and If-Match parsing, with an in-process write stub
+"""
+
+import asyncio
+
+import pytest
+
+from annotation_store import SaveCoalescer, VersionConflict, format_etag, parse_if_match
+
+WINDOW = 0.05
+
+
+class FakeStore:
+    """write() for SaveCoalescer that versions documents like write_annotations does"""
+
+    def __init__(self, fail: Exception = None):
+        self.documents = {}
+        self.revisions = {}
+        self.writes = []
+        self.fail = fail
+
+    def write(self, key, document, expected):
+        self.writes.append((key, document, expected))
+        if self.fail is not None:
+            raise self.fail
+        revision = self.revisions.get(key)
+        if expected is not None and expected != "*" and expected != (1, revision):
+            raise VersionConflict((1, revision) if revision else None)
+        self.revisions[key] = (revision or 0) + 1
+        self.documents[key] = document
+        return 1, self.revisions[key]
+
+
+def run(*saves):
+    """Submit the (coalescer, key, document, expected) saves concurrently, in order"""
+    async def main():
+        return await asyncio.gather(
+            *(coalescer.submit(key, document, expected) for coalescer, key, document, expected in saves),
+            return_exceptions=True,
+        )
+    return asyncio.run(main())
+
+
+def test_unconditional_saves_merge_into_one_write_of_the_newest_document():
+    store = FakeStore()
+    coalescer = SaveCoalescer(store.write, window=WINDOW)
+    results = run(*[(coalescer, 7, {"n": n}, None) for n in range(3)])
+
+    assert store.writes == [(7, {"n": 2}, None)]
+    assert results == [((1, 1), 3)] * 3
+
+
+def test_saves_for_different_keys_are_written_separately():
+    store = FakeStore()
+    coalescer = SaveCoalescer(store.write, window=WINDOW)
+    run((coalescer, 1, "a", None), (coalescer, 2, "b", None))
+    assert sorted(store.writes) == [(1, "a", None), (2, "b", None)]
+
+
+def test_conditional_save_never_merges_and_conflicts_after_the_pending_write():
+    store = FakeStore()
+    store.revisions[7] = 1
+    coalescer = SaveCoalescer(store.write, window=WINDOW)
+    first, second = run((coalescer, 7, "first", (1, 1)), (coalescer, 7, "second", (1, 1)))
+
+    assert first == ((1, 2), 1)
+    assert isinstance(second, VersionConflict) and second.current == (1, 2)
+    assert [document for _, document, _ in store.writes] == ["first", "second"]
+    assert store.documents[7] == "first"
+
+
+def test_unconditional_save_does_not_merge_into_a_conditional_one():
+    store = FakeStore()
+    store.revisions[7] = 1
+    coalescer = SaveCoalescer(store.write, window=WINDOW)
+    first, second = run((coalescer, 7, "checked", (1, 1)), (coalescer, 7, "blind", None))
+
+    assert first == ((1, 2), 1)
+    assert second == ((1, 3), 1)
+    assert store.documents[7] == "blind"
+
+
+def test_every_waiter_receives_the_failed_writes_exception():
+    error = RuntimeError("database is down")
+    store = FakeStore(fail=error)
+    coalescer = SaveCoalescer(store.write, window=WINDOW)
+    results = run(*[(coalescer, 7, n, None) for n in range(3)])
+
+    assert results == [error] * 3
+    assert len(store.writes) == 1
+    assert coalescer._pending == {}
+
+
+def test_zero_window_writes_every_save():
+    store = FakeStore()
+    coalescer = SaveCoalescer(store.write, window=0)
+    results = run((coalescer, 7, "a", None), (coalescer, 7, "b", None))
+    assert len(store.writes) == 2
+    assert sorted(results) == [((1, 1), 1), ((1, 2), 1)]
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("*", "*"),
+    (format_etag(3, 9), (3, 9)),
+    ('W/"3-9"', (-1, -1)),
+    ('"garbage"', (-1, -1)),
+])
+def test_parse_if_match(header, expected):
+    assert parse_if_match(header) == expected
@@ -0,0 +1,89 @@
+"""
+Incremental CSV/NDJSON parsing for /upload/stream
+"""
+
+import asyncio
+
+from bulk_import import _complete_csv_records, iter_records
+
+
+def parse(chunks, fmt, **kwargs):
+    async def body():
+        for chunk in chunks:
+            yield chunk
+
+    async def collect():
+        return [item async for item in iter_records(body(), fmt, **kwargs)]
+
+    return asyncio.run(collect())
+
+
+def split_everywhere(data: bytes):
+    """The body cut into two chunks at every possible position"""
+    return [[data[:cut], data[cut:]] for cut in range(len(data) + 1)]
+
+
+def errors(records):
+    return [(row, str(record)) for row, record in records if isinstance(record, Exception)]
+
+
+def test_complete_csv_records_keeps_quoted_newlines_together():
+    records, tail = _complete_csv_records('a,"line one\nline two"\nb,c\nd,"open\n')
+    assert records == ['a,"line one\nline two"\n', "b,c\n"]
+    assert tail == 'd,"open\n'
+
+
+def test_csv_quoted_newline_split_across_chunks():
+    data = b'name,snippet\nAda,"first\nsecond"\nBob,plain\n'
+    for chunks in split_everywhere(data):
+        assert parse(chunks, "csv") == [
+            (1, {"name": "Ada", "snippet": "first\nsecond"}),
+            (2, {"name": "Bob", "snippet": "plain"}),
+        ], chunks
+
+
+def test_crlf_split_across_chunk_boundary():
+    for fmt, data in (("csv", b"name,role\r\nAda,Engineer\r\nBob,Manager\r\n"),
+                      ("ndjson", b'{"name": "Ada"}\r\n{"name": "Bob"}\r\n')):
+        for chunks in split_everywhere(data):
+            names = [record["name"] for _, record in parse(chunks, fmt)]
+            assert names == ["Ada", "Bob"], (fmt, chunks)
+
+
+def test_byte_order_mark_is_dropped_even_when_split():
+    data = "\ufeffname,role\nAda,Engineer\n".encode()
+    for chunks in split_everywhere(data):
+        assert parse(chunks, "csv") == [(1, {"name": "Ada", "role": "Engineer"})], chunks
+
+
+def test_multibyte_character_split_across_chunks():
+    data = '{"name": "Zoë"}\n'.encode()
+    for chunks in split_everywhere(data):
+        assert parse(chunks, "ndjson") == [(1, {"name": "Zoë"})]
+
+
+def test_ndjson_reports_invalid_and_non_object_lines():
+    records = parse([b'{"name": "Ada"}\n[1, 2]\n"text"\n\n{oops\n{"name": "Bob"}'], "ndjson")
+    assert [(row, record) for row, record in records if isinstance(record, dict)] == [
+        (1, {"name": "Ada"}), (5, {"name": "Bob"})
+    ]
+    assert [row for row, _ in errors(records)] == [2, 3, 4]
+    assert "expected a JSON object, got list" in errors(records)[0][1]
+
+
+def test_csv_reports_rows_with_the_wrong_column_count():
+    records = parse([b"name,role\nAda,Engineer\nBob\n"], "csv")
+    assert errors(records) == [(2, "expected 2 columns, got 1")]
+
+
+def test_record_without_line_break_is_capped():
+    # A body that never ends its first record must not be buffered whole
+    chunks = [b'{"name": "' + b"x" * 40] * 10 + [b'"}\n{"name": "Ada"}\n']
+    records = parse(chunks, "ndjson", max_record_length=100)
+    assert errors(records) == [(1, "record is longer than 100 characters")]
+    assert records[1:] == [(2, {"name": "Ada"})]
+
+
+def test_records_within_the_cap_are_unaffected():
+    line = b'{"name": "' + b"x" * 80 + b'"}\n'
+    assert len(parse([line[:50], line[50:]], "ndjson", max_record_length=100)) == 1
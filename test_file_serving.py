@@ -0,0 +1,114 @@
+"""
+Conditional and byte-range file responses
+"""
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from file_serving import RangeNotSatisfiable, etag_matches, file_response, iter_file_range, parse_range
+
+CONTENT = bytes(range(256)) * 40  # 10240 bytes
+
+
+@pytest.fixture
+def document(tmp_path):
+    path = tmp_path / "document.pdf"
+    path.write_bytes(CONTENT)
+    return str(path)
+
+
+@pytest.fixture
+def client(document):
+    app = FastAPI()
+
+    @app.api_route("/document", methods=["GET", "HEAD"])
+    def get_document(request: Request):
+        return file_response(request, document, "application/pdf", "no-cache")
+
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    (" bytes = 5 - 5 ", (5, 5)),
+    # Ignored, so the whole file is sent
+    ("bytes=9-3", None),
+    ("bytes=-", None),
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header, size", [("bytes=1000-", 1000), ("bytes=-0", 1000), ("bytes=-10", 0)])
+def test_unsatisfiable_ranges(header, size):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, size)
+
+
+def test_iter_file_range_slices(document):
+    assert b"".join(iter_file_range(document, 0, len(CONTENT) - 1, chunk_size=4096)) == CONTENT
+    chunks = list(iter_file_range(document, 10, 9000, chunk_size=4096))
+    assert [len(chunk) for chunk in chunks] == [4096, 4096, 799]
+    assert b"".join(chunks) == CONTENT[10:9001]
+    assert list(iter_file_range(document, 5, 4)) == []
+
+
+def test_etag_matches_is_weak():
+    assert etag_matches('W/"a", "b"', '"b"') and etag_matches('W/"a"', '"a"') and etag_matches("*", '"a"')
+    assert not etag_matches(None, '"a"') and not etag_matches('"c"', '"a"')
+
+
+def test_whole_file_and_head(client):
+    response = client.get("/document")
+    assert response.status_code == 200 and response.content == CONTENT
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-length"] == str(len(CONTENT))
+
+    head = client.head("/document")
+    assert head.status_code == 200 and head.content == b""
+    assert head.headers["content-length"] == str(len(CONTENT))
+
+
+def test_range_returns_partial_content(client):
+    response = client.get("/document", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[100:200]
+    assert response.headers["content-range"] == f"bytes 100-199/{len(CONTENT)}"
+
+
+def test_invalid_range_is_ignored(client):
+    response = client.get("/document", headers={"Range": "bytes=9-3"})
+    assert response.status_code == 200 and response.content == CONTENT
+
+
+def test_range_outside_the_file_is_416(client):
+    response = client.get("/document", headers={"Range": f"bytes={len(CONTENT)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+
+def test_if_none_match_returns_304(client):
+    etag = client.head("/document").headers["etag"]
+    response = client.get("/document", headers={"If-None-Match": f'W/"other", {etag}'})
+    assert response.status_code == 304 and response.content == b""
+    assert client.get("/document", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_if_range_matching_etag_or_date_honours_the_range(client):
+    head = client.head("/document").headers
+    for validator in (head["etag"], head["last-modified"]):
+        response = client.get("/document", headers={"Range": "bytes=0-9", "If-Range": validator})
+        assert response.status_code == 206 and response.content == CONTENT[:10]
+
+
+def test_stale_if_range_sends_the_whole_file(client):
+    response = client.get("/document", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200 and response.content == CONTENT
@@ -0,0 +1,69 @@
+"""
+JSON Merge Patch (RFC 7396) and JSON Patch (RFC 6902) on annotation documents
+"""
+
+import pytest
+
+from json_patch import JsonPatchError, apply_patch, merge_patch
+
+DOCUMENT = {
+    "format": "https://pspdfkit.com/instant-json/v1",
+    "annotations": [{"id": "a", "pageIndex": 0}, {"id": "b", "pageIndex": 1}],
+}
+
+
+def test_merge_patch_merges_objects_and_deletes_nulls():
+    target = {"a": {"b": 1, "c": 2}, "d": 3}
+    assert merge_patch(target, {"a": {"b": None, "e": 4}, "d": [1]}) == {"a": {"c": 2, "e": 4}, "d": [1]}
+    assert target == {"a": {"b": 1, "c": 2}, "d": 3}
+
+
+def test_merge_patch_non_object_replaces_the_target():
+    assert merge_patch({"a": 1}, ["x"]) == ["x"]
+    assert merge_patch("scalar", {"a": 1}) == {"a": 1}
+
+
+def test_apply_patch_operations():
+    patched = apply_patch(DOCUMENT, [
+        {"op": "add", "path": "/annotations/-", "value": {"id": "c", "pageIndex": 2}},
+        {"op": "replace", "path": "/annotations/0/pageIndex", "value": 5},
+        {"op": "remove", "path": "/annotations/1"},
+        {"op": "copy", "from": "/annotations/0/id", "path": "/first"},
+        {"op": "move", "from": "/first", "path": "/selected"},
+        {"op": "test", "path": "/selected", "value": "a"},
+    ])
+    assert patched == {
+        "format": DOCUMENT["format"],
+        "annotations": [{"id": "a", "pageIndex": 5}, {"id": "c", "pageIndex": 2}],
+        "selected": "a",
+    }
+    assert len(DOCUMENT["annotations"]) == 2
+
+
+def test_pointer_escapes():
+    assert apply_patch({"a/b": 1, "m~n": 2}, [
+        {"op": "remove", "path": "/a~1b"},
+        {"op": "replace", "path": "/m~0n", "value": 3},
+    ]) == {"m~n": 3}
+
+
+@pytest.mark.parametrize("operations", [
+    {"op": "add"},
+    [{"op": "add", "path": "/x"}],
+    [{"op": "remove", "path": "/missing"}],
+    [{"op": "replace", "path": "/annotations/5", "value": 1}],
+    [{"op": "add", "path": "/annotations/01", "value": 1}],
+    [{"op": "move", "from": "/annotations", "path": "/annotations/0"}],
+    [{"op": "test", "path": "/format", "value": "other"}],
+    [{"op": "frobnicate", "path": "/format"}],
+    [{"op": "remove", "path": "format"}],
+])
+def test_invalid_patches_raise(operations):
+    with pytest.raises(JsonPatchError):
+        apply_patch(DOCUMENT, operations)
+
+
+def test_failed_patch_leaves_document_untouched():
+    with pytest.raises(JsonPatchError):
+        apply_patch(DOCUMENT, [{"op": "remove", "path": "/annotations/0"}, {"op": "remove", "path": "/missing"}])
+    assert len(DOCUMENT["annotations"]) == 2
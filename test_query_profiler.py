@@ -0,0 +1,78 @@
+"""
+Query budgets in strict profiling mode, on an in-memory SQLite engine
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+import query_profiler
+from query_profiler import QueryBudgetExceeded, QueryProfile, QueryProfilerMiddleware, query_budget
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(query_profiler, "STRICT", True)
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    query_profiler.instrument(engine)
+
+    app = FastAPI()
+    app.add_middleware(QueryProfilerMiddleware)
+
+    def run(statements: int):
+        with engine.connect() as conn:
+            for _ in range(statements):
+                conn.execute(text("SELECT 1"))
+        return {"statements": statements}
+
+    @app.get("/within")
+    @query_budget(2)
+    def within():
+        return run(2)
+
+    @app.get("/over")
+    @query_budget(2)
+    def over():
+        return run(3)
+
+    @app.get("/unprofiled")
+    @query_budget(2)
+    def unprofiled():
+        with engine.connect() as conn:
+            for _ in range(3):
+                conn.execute(text("SELECT 1"), execution_options={"query_profile": False})
+        return run(2)
+
+    return TestClient(app)
+
+
+def test_handler_within_budget_passes(client):
+    assert client.get("/within").json() == {"statements": 2}
+
+
+def test_budget_overrun_fails_the_request(client):
+    with pytest.raises(QueryBudgetExceeded, match="GET /over ran 3 statements, budget is 2"):
+        client.get("/over")
+
+
+def test_statements_opted_out_of_profiling_are_not_counted(client):
+    assert client.get("/unprofiled").json() == {"statements": 2}
+
+
+def test_overrun_only_logs_outside_strict_mode(monkeypatch, caplog):
+    monkeypatch.setattr(query_profiler, "STRICT", False)
+    profile = QueryProfile()
+    for _ in range(3):
+        profile.record("SELECT 1", 0.0)
+    query_profiler.report(profile, "GET /over", budget=2)
+    assert "GET /over ran 3 statements, budget is 2" in caplog.text
+
+
+def test_repeated_statements_are_reported_as_n_plus_one():
+    profile = QueryProfile()
+    for _ in range(5):
+        profile.record("SELECT * FROM managers\n WHERE id = ?", 0.0)
+    profile.record("SELECT 1", 0.0)
+    assert profile.repeated(threshold=5) == [("SELECT * FROM managers WHERE id = ?", 5)]
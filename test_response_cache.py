@@ -0,0 +1,118 @@
+"""
+ResponseCache invalidation and MemoryBackend bounds, without a database
+"""
+
+import time
+
+from starlette.requests import Request
+
+from response_cache import CachedResponse, MemoryBackend, ResponseCache
+
+
+def make_request(query: str = "", if_none_match: str = None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/org-chart", "query_string": query.encode(),
+                    "headers": headers})
+
+
+def entry(body: bytes, tables=("employees",), ttl: float = 60) -> CachedResponse:
+    return CachedResponse(body, '"etag"', tables, time.monotonic() + ttl)
+
+
+def test_hit_miss_and_not_modified():
+    cache = ResponseCache(MemoryBackend())
+    builds = []
+
+    def build():
+        builds.append(1)
+        return {"rows": [1, 2]}
+
+    miss = cache.serve(make_request(), "/org-chart", ("employees",), build)
+    hit = cache.serve(make_request(), "/org-chart", ("employees",), build)
+    assert (miss.headers["X-Cache"], hit.headers["X-Cache"]) == ("MISS", "HIT")
+    assert hit.body == miss.body == b'{"rows":[1,2]}'
+    assert len(builds) == 1
+
+    revalidated = cache.serve(make_request(if_none_match=hit.headers["ETag"]), "/org-chart", ("employees",), build)
+    assert revalidated.status_code == 304
+
+
+def test_query_string_is_part_of_the_key():
+    cache = ResponseCache(MemoryBackend())
+    cache.serve(make_request("page=1"), "/api/managers", ("managers",), lambda: [1])
+    response = cache.serve(make_request("page=2"), "/api/managers", ("managers",), lambda: [2])
+    assert response.headers["X-Cache"] == "MISS" and response.body == b"[2]"
+
+
+def test_invalidate_change_drops_entries_of_the_touched_tables():
+    cache = ResponseCache(MemoryBackend())
+    cache.serve(make_request(), "/org-chart", ("employees",), lambda: [1])
+    cache.serve(make_request(), "/api/managers", ("managers",), lambda: [2])
+
+    cache.invalidate_change({"entity": "annotation", "op": "update", "ids": [1]})
+    assert len(cache.backend) == 1 and cache.backend.get("/api/managers?") is not None
+
+    cache.invalidate_change({"entity": "manager", "op": "update", "ids": [1]})
+    assert len(cache.backend) == 0
+
+
+def test_import_and_resync_drop_everything():
+    for change in ({"entity": "employee", "op": "import"}, {"op": "resync"}):
+        cache = ResponseCache(MemoryBackend())
+        cache.serve(make_request(), "/org-chart", ("employees",), lambda: [1])
+        cache.serve(make_request(), "/api/managers", ("managers",), lambda: [2])
+        cache.invalidate_change(change)
+        assert len(cache.backend) == 0, change
+
+
+def test_build_overlapping_a_write_is_not_stored():
+    cache = ResponseCache(MemoryBackend())
+
+    def build_during_write():
+        # A write to employees commits while the response is being built
+        cache.invalidate_change({"entity": "employee", "op": "update", "ids": [1]})
+        return {"stale": True}
+
+    response = cache.serve(make_request(), "/org-chart", ("employees",), build_during_write)
+    assert response.headers["X-Cache"] == "MISS" and response.body == b'{"stale":true}'
+    assert len(cache.backend) == 0
+
+    # A write to a table the response doesn't read doesn't matter
+    cache.serve(make_request(), "/org-chart", ("employees",),
+                lambda: cache.invalidate_change({"entity": "unknown", "op": "update"}) or [1])
+    assert len(cache.backend) == 1
+
+
+def test_memory_backend_expires_entries():
+    backend = MemoryBackend()
+    backend.set("old", entry(b"1", ttl=-1))
+    backend.set("new", entry(b"2"))
+    assert backend.get("old") is None and backend.get("new").body == b"2"
+    assert len(backend) == 1 and backend.size_bytes == 1
+
+
+def test_memory_backend_evicts_least_recently_used_within_entry_and_byte_bounds():
+    backend = MemoryBackend(max_entries=3, max_bytes=10)
+    for key in "abc":
+        backend.set(key, entry(b"xxx"))
+    backend.get("a")
+    # Over max_entries: b is the least recently used
+    backend.set("d", entry(b"yyy"))
+    assert list(backend._entries) == ["c", "a", "d"]
+
+    # 9 bytes held; 4 more evicts from the LRU end until the total fits
+    backend.set("e", entry(b"zzzz"))
+    assert list(backend._entries) == ["a", "d", "e"] and backend.size_bytes == 10
+
+
+def test_memory_backend_skips_entries_larger_than_the_byte_bound():
+    backend = MemoryBackend(max_bytes=4)
+    backend.set("big", entry(b"12345"))
+    assert len(backend) == 0 and backend.size_bytes == 0
+
+
+def test_replacing_an_entry_keeps_the_byte_count():
+    backend = MemoryBackend()
+    backend.set("a", entry(b"123"))
+    backend.set("a", entry(b"12"))
+    assert len(backend) == 1 and backend.size_bytes == 2
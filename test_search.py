@@ -0,0 +1,59 @@
+"""
+Keyset cursors for the /api/search listing
+"""
+
+import base64
+
+import pytest
+
+from search import (
+    SEARCH_RESULT_CAP,
+    SORT_COLUMNS,
+    build_ranked_search_query,
+    build_search_query,
+    decode_cursor,
+    encode_cursor,
+    next_cursor,
+)
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(7, 42)) == (7, 42)
+    # Employees without a manager sort first, as COALESCE(manager_id, 0)
+    assert decode_cursor(encode_cursor(None, 3)) == (0, 3)
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b'["Alice", 1]').decode(),
+    base64.urlsafe_b64encode(b"[1, 2, 3]").decode(),
+    base64.urlsafe_b64encode(b"[true, 2]").decode(),
+])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_query_resumes_after_cursor():
+    statement, params = build_search_query(encode_cursor(7, 42), limit=50)
+    sql = " ".join(statement.text.split())
+    assert f"WHERE ({SORT_COLUMNS}) > (:cursor_manager, :cursor_id) ORDER BY {SORT_COLUMNS} LIMIT :limit" in sql
+    assert params == {"cursor_manager": 7, "cursor_id": 42, "limit": 51}
+
+
+def test_unpaged_query_has_no_limit():
+    statement, params = build_search_query()
+    assert "LIMIT" not in statement.text and params == {}
+
+
+def test_next_cursor_trims_look_ahead_row():
+    rows = [{"id": i, "manager_id": 1} for i in range(4)]
+    assert decode_cursor(next_cursor(rows, 3)) == (1, 2)
+    assert len(rows) == 3
+    assert next_cursor(rows, 3) is None
+
+
+def test_ranked_search_escapes_like_wildcards_and_caps_limit():
+    statement, params = build_ranked_search_query("50%_a", limit=10_000)
+    assert params == {"name": "50%_a", "pattern": "%50\\%\\_a%", "limit": SEARCH_RESULT_CAP}
+    assert "ORDER BY :name <<-> e.name LIMIT :limit" in " ".join(statement.text.split())
@@ -0,0 +1,44 @@
+"""
+Rectangle queries on GridIndex
+"""
+
+from array import array
+
+from spatial import GridIndex
+
+# Three words on a line, one far down the page and one spanning several cells
+BOXES = array("f", [
+    10, 10, 40, 20,
+    50, 10, 90, 20,
+    100, 10, 140, 20,
+    10, 700, 40, 710,
+    0, 300, 500, 320,
+])
+
+
+def brute_force(x0, y0, x1, y1):
+    return [
+        number for number in range(len(BOXES) // 4)
+        if BOXES[number * 4] <= x1 and BOXES[number * 4 + 2] >= x0
+        and BOXES[number * 4 + 1] <= y1 and BOXES[number * 4 + 3] >= y0
+    ]
+
+
+def test_query_returns_intersecting_boxes_in_insertion_order():
+    index = GridIndex(BOXES, cell_size=48)
+    assert len(index) == 5
+    assert index.query(45, 5, 105, 15) == [1, 2]
+    assert index.query(0, 0, 1000, 1000) == [0, 1, 2, 3, 4]
+    assert index.query(200, 500, 300, 600) == []
+
+
+def test_reversed_rectangle_is_normalized():
+    index = GridIndex(BOXES, cell_size=48)
+    assert index.query(105, 15, 45, 5) == [1, 2]
+
+
+def test_matches_brute_force_for_any_cell_size():
+    for cell_size in (8, 48, 1000):
+        index = GridIndex(BOXES, cell_size=cell_size)
+        for rectangle in [(0, 0, 30, 30), (35, 0, 60, 400), (400, 310, 410, 310), (0, 705, 5000, 5000)]:
+            assert index.query(*rectangle) == brute_force(*rectangle), (cell_size, rectangle)
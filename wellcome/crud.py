@@ -1,8 +1,66 @@
+import base64
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from . import models, schemas
 
+# Columns of a listed employee, in EmployeeOut order
+EMPLOYEE_COLUMNS = ("id", "name", "email", "department")
+
+
+def _employee_rows(query) -> List[dict]:
+    # Plain column tuples: no ORM identity map, no attribute introspection when serializing
+    return [dict(zip(EMPLOYEE_COLUMNS, row)) for row in query]
+
+
+def _listing(db: Session):
+    employee = models.Employee
+    return db.query(employee.id, employee.name, employee.email, employee.department)
+
+
 def get_employees(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Employee).offset(skip).limit(limit).all()
+    """OFFSET paging, kept for existing callers; deep pages scan every skipped row"""
+    return _employee_rows(_listing(db).order_by(models.Employee.id).offset(skip).limit(limit))
+
+
+def encode_cursor(employee_id: int) -> str:
+    """Opaque token for the keyset position after `employee_id`"""
+    return base64.urlsafe_b64encode(str(employee_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Decode a token from encode_cursor; raises ValueError if it is malformed"""
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def get_employees_page(db: Session, cursor: Optional[str] = None, limit: int = 100) -> Tuple[List[dict], Optional[str]]:
+    """
+    Keyset page of employees ordered by id, and the cursor of the next page
+    (None on the last one). Each page is an index range scan on the primary
+    key starting after the cursor, so deep pages cost the same as the first.
+    """
+    query = _listing(db)
+    if cursor:
+        query = query.filter(models.Employee.id > decode_cursor(cursor))
+    # One extra row tells us whether another page exists
+    rows = _employee_rows(query.order_by(models.Employee.id).limit(limit + 1))
+    if len(rows) <= limit:
+        return rows, None
+    del rows[limit:]
+    return rows, encode_cursor(rows[-1]["id"])
+
+
+def estimate_employee_count(db: Session) -> Optional[int]:
+    """
+    Row count from the planner statistics (kept current by autovacuum and
+    ANALYZE) instead of a full COUNT(*); None if the table was never analyzed.
+    """
+    estimate = db.execute(text("SELECT reltuples FROM pg_class WHERE oid = 'employees'::regclass")).scalar()
+    return int(estimate) if estimate is not None and estimate >= 0 else None
 
 def create_employee(db: Session, employee: schemas.EmployeeCreate):
     db_employee = models.Employee(**employee.dict())
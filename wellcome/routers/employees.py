@@ -1,4 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, Response
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from serialization import FastJSONResponse
 from sqlalchemy.orm import Session
 from .. import crud, schemas
 from ..database import SessionLocal
@@ -15,8 +18,41 @@ def get_db():
 
 # GET all employees
 @router.get("")
-def read_employees(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_employees(db, skip=skip, limit=limit)
+def read_employees(
+    skip: Optional[int] = Query(None, ge=0),
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = None,
+    estimate_total: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    Pages through employees by id. Pass the X-Next-Cursor header of a
+    response as `cursor` to get the next page; there is none after the
+    last page. `skip` still does OFFSET paging for existing callers.
+    With `estimate_total`, X-Total-Estimate carries the approximate
+    number of employees from table statistics.
+    """
+    headers = {}
+    if skip is not None:
+        if cursor:
+            raise HTTPException(status_code=400, detail="cursor cannot be combined with skip")
+        employees = crud.get_employees(db, skip=skip, limit=limit)
+    else:
+        try:
+            employees, next_cursor = crud.get_employees_page(db, cursor=cursor, limit=limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+
+    if estimate_total:
+        total = crud.estimate_employee_count(db)
+        if total is not None:
+            headers["X-Total-Estimate"] = str(total)
+
+    # Rows are already plain dicts; skip FastAPI's per-object encoding pass and
+    # encode with orjson like the main app's list endpoints
+    return FastJSONResponse(employees, headers=headers)
 
 # POST bulk create employees
 @router.post("/bulk_create")